@@ -0,0 +1,241 @@
+import os
+import sys
+import gzip
+import json
+import time
+import asyncio
+import argparse
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from services.prompts import initialize_prompt, format_image_context, finalize_prompt
+from services.stage_metrics import percentile
+
+llm_endpoint_name = "huggingface-pytorch-tgi-inference-2024-03-08-17-46-49-268"
+
+
+def parse_args():
+    """Parse the arguments."""
+    parser = argparse.ArgumentParser(description="Generate comments for a dataset of posts in batch, for evaluation and backfills.")
+    parser.add_argument("--input_path", type=str, default="training_data.csv", help="training_data.csv or a DynamoDB export (.json/.json.gz, one item per line).")
+    parser.add_argument("--output_path", type=str, default="generated_comments.jsonl", help="JSONL file results are appended to.")
+    parser.add_argument("--backend", type=str, default="sagemaker", choices=["sagemaker", "local"], help="Where the comments are generated.")
+    parser.add_argument("--endpoint_name", type=str, default=llm_endpoint_name, help="SageMaker endpoint of the fine-tuned model.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent endpoint requests (sagemaker backend).")
+    parser.add_argument("--fake", action="store_true", help="Answer endpoint requests with services.fakes.FakeBackend, for offline runs.")
+    parser.add_argument("--model_name_or_path", type=str, default=None, help="Hugging Face model ID or folder (local backend).")
+    parser.add_argument("--batch_size", type=int, default=8, help="Prompts per generate call (local backend).")
+    parser.add_argument("--max_new_tokens", type=int, default=64, help="Max new tokens per comment.")
+    parser.add_argument("--temperature", type=float, default=0.6, help="Sampling temperature.")
+    parser.add_argument("--top_p", type=float, default=0.9, help="Nucleus sampling top p.")
+    parser.add_argument("--limit", type=int, default=None, help="Only generate for the first N posts.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for local sampling.")
+    return parser.parse_args()
+
+
+def load_records(input_path):
+    """Load posts from training_data.csv or a DynamoDB table export."""
+    if input_path.endswith(".csv"):
+        # training_data.csv is written with the pandas index as its first column
+        df = pd.read_csv(input_path, index_col=0, keep_default_na=False)
+        return df.to_dict("records")
+
+    # DynamoDB export to S3 in DynamoDB JSON: one {"Item": {...}} per line, gzipped
+    from boto3.dynamodb.types import TypeDeserializer
+
+    deserializer = TypeDeserializer()
+    opener = gzip.open if input_path.endswith(".gz") else open
+    records = []
+    with opener(input_path, "rt") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)["Item"]
+                records.append({key: deserializer.deserialize(value) for key, value in item.items()})
+    return records
+
+
+def build_prompt(record):
+    """Build the same prompt the Lambdas send to the model."""
+    prompt = initialize_prompt({"title": record["title"], "body": record.get("body") or ""})
+
+    if "blipCaption" in record:
+        # enriched items from DynamoDB hold Rekognition results as lists, joined as in the Lambdas
+        celebrities = record.get("celebrityRekognition") or []
+        detected_texts = record.get("textRekognition") or []
+        if not isinstance(celebrities, str):
+            celebrities = ", ".join(celebrities)
+        if not isinstance(detected_texts, str):
+            detected_texts = " ".join(detected_texts)
+        image_context = format_image_context(record["blipCaption"], celebrities, detected_texts)
+    else:
+        # training_data.csv already holds the formatted image context
+        image_context = record.get("image_description", "") + "\n\n"
+
+    return finalize_prompt(prompt, image_context)
+
+
+class SageMakerBackend:
+    """Generate with the TGI endpoint, one prompt per request and `concurrency` requests in flight."""
+
+    batch_size = 1
+
+    def __init__(self, endpoint_name, parameters, concurrency, fake=False):
+        self.endpoint_name = endpoint_name
+        self.parameters = parameters
+        self.concurrency = concurrency
+        self.fake = fake
+
+    async def __aenter__(self):
+        from services.async_clients import AsyncServices, ServiceConfig
+
+        backend = None
+        if self.fake:
+            from services.fakes import FakeBackend
+            backend = FakeBackend()
+        self.services = AsyncServices(ServiceConfig(max_connections=self.concurrency), backend=backend)
+        await self.services.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.services.__aexit__(*exc_info)
+
+    async def generate(self, prompts):
+        # TGI details carry the generated token count along with the text
+        text, details = await self.services.get_llama_response(
+            self.endpoint_name, prompts[0], self.parameters, return_details=True
+        )
+        return [(text, details.get("generated_tokens", len(text.split())))]
+
+
+class LocalBackend:
+    """Generate with a local Hugging Face causal LM, `batch_size` prompts per left-padded generate call."""
+
+    concurrency = 1
+
+    def __init__(self, model_name_or_path, parameters, batch_size, seed):
+        self.model_name_or_path = model_name_or_path
+        self.parameters = parameters
+        self.batch_size = batch_size
+        self.seed = seed
+
+    async def __aenter__(self):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        torch.manual_seed(self.seed)
+        self.torch = torch
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name_or_path, padding_side="left")
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        dtype = torch.bfloat16 if self.device == "cuda" else torch.float32
+        self.model = AutoModelForCausalLM.from_pretrained(self.model_name_or_path, torch_dtype=dtype).to(self.device).eval()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def generate(self, prompts):
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+        with self.torch.inference_mode():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=self.parameters["max_new_tokens"],
+                do_sample=True,
+                temperature=self.parameters["temperature"],
+                top_p=self.parameters["top_p"],
+                pad_token_id=self.tokenizer.pad_token_id,
+            )
+        generated = output[:, inputs["input_ids"].shape[1]:]
+        results = []
+        for tokens in generated:
+            # count up to and including the first end of sequence token, the rest is padding
+            eos_positions = (tokens == self.tokenizer.eos_token_id).nonzero()
+            num_tokens = int(eos_positions[0]) + 1 if len(eos_positions) else len(tokens)
+            results.append((self.tokenizer.decode(tokens[:num_tokens], skip_special_tokens=True).strip(), num_tokens))
+        return results
+
+
+def completed_ids(output_path):
+    """Submission IDs already written to the output, so an interrupted backfill resumes where it stopped."""
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path) as f:
+        return {json.loads(line)["submissionId"] for line in f if line.strip()}
+
+
+async def generate_all(backend, records, output_file):
+    """Run every record through the backend with `concurrency` workers, appending results as they finish."""
+    queue = asyncio.Queue()
+    for i in range(0, len(records), backend.batch_size):
+        queue.put_nowait(records[i:i + backend.batch_size])
+    stats = {"latencies": [], "tokens": 0, "errors": 0}
+
+    async def worker():
+        while not queue.empty():
+            batch = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                results = await backend.generate([build_prompt(record) for record in batch])
+            except Exception as e:
+                print(f"Failed batch starting at {batch[0]['submissionId']}: {e}")
+                stats["errors"] += len(batch)
+                continue
+            latency = time.perf_counter() - start
+            for record, (comment, num_tokens) in zip(batch, results):
+                output_file.write(json.dumps({
+                    "submissionId": record["submissionId"],
+                    "generatedComment": comment,
+                    "topComment": record.get("topComment"),
+                    "generatedTokens": num_tokens,
+                    "latencySeconds": latency,
+                }) + "\n")
+                stats["latencies"].append(latency)
+                stats["tokens"] += num_tokens
+            output_file.flush()
+
+    await asyncio.gather(*[worker() for _ in range(backend.concurrency)])
+    return stats
+
+
+async def run(args, records):
+    parameters = {"max_new_tokens": args.max_new_tokens, "temperature": args.temperature, "top_p": args.top_p}
+    if args.backend == "sagemaker":
+        backend = SageMakerBackend(args.endpoint_name, {**parameters, "stop": ["</s>"]}, args.concurrency, fake=args.fake)
+    else:
+        backend = LocalBackend(args.model_name_or_path, parameters, args.batch_size, args.seed)
+
+    async with backend:
+        with open(args.output_path, "a") as output_file:
+            start = time.perf_counter()
+            stats = await generate_all(backend, records, output_file)
+            stats["wall_time"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    args = parse_args()
+    records = load_records(args.input_path)[:args.limit]
+
+    done = completed_ids(args.output_path)
+    pending = [record for record in records if record["submissionId"] not in done]
+    print(f"Posts: {len(records)} || Already generated: {len(records) - len(pending)} || To generate: {len(pending)}")
+    if not pending:
+        return
+
+    stats = asyncio.run(run(args, pending))
+
+    latencies = stats["latencies"]
+    generated = len(latencies)
+    print(f"Generated: {generated} || Errors: {stats['errors']} || Wall time: {stats['wall_time']:.1f} s")
+    if generated:
+        print(f"Throughput: {generated / stats['wall_time']:.2f} posts/s, {stats['tokens'] / stats['wall_time']:.1f} tokens/s "
+              f"|| Latency p50: {percentile(latencies, 50):.2f} s, p90: {percentile(latencies, 90):.2f} s, p99: {percentile(latencies, 99):.2f} s")
+    print(f"Results written to {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_comments import build_prompt, completed_ids, generate_all, run, SageMakerBackend
+
+RECORDS = [
+    {"submissionId": "csv001", "title": "Nailed it", "body": "", "image_description": "- Description:a cake", "topComment": "Top"},
+    {
+        "submissionId": "ddb002",
+        "title": "Found this sign",
+        "body": "on my way to work",
+        "blipCaption": "a sign on a pole",
+        "celebrityRekognition": ["Keanu Reeves", "Tom Hanks"],
+        "textRekognition": ["NO", "PARKING"],
+    },
+    {"submissionId": "csv003", "title": "My dog", "body": "", "image_description": "- Description:a dog"},
+]
+
+VOCAB = ["<pad>", "<s>", "</s>", "<unk>", "a", "the", "dog", "cake", "sign", "funny", "###", "Response:"]
+
+
+def make_args(output_path, **overrides):
+    args = argparse.Namespace(
+        backend="sagemaker", endpoint_name="endpoint", concurrency=2, fake=True, model_name_or_path=None,
+        batch_size=2, max_new_tokens=8, temperature=0.6, top_p=0.9, seed=42, output_path=str(output_path),
+    )
+    vars(args).update(overrides)
+    return args
+
+
+def read_rows(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.fixture(scope="module")
+def tiny_model_dir(tmp_path_factory):
+    """A randomly initialized two-layer Llama with a word level tokenizer, saved like a Hub model."""
+    torch = pytest.importorskip("torch")
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    path = tmp_path_factory.mktemp("tiny_llama")
+    tokenizer = Tokenizer(models.WordLevel({token: i for i, token in enumerate(VOCAB)}, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>", unk_token="<unk>", pad_token="<pad>"
+    ).save_pretrained(path)
+
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=len(VOCAB), hidden_size=16, intermediate_size=32, num_hidden_layers=2, num_attention_heads=2,
+        num_key_value_heads=2, max_position_embeddings=256, bos_token_id=1, eos_token_id=2, pad_token_id=0,
+    )
+    LlamaForCausalLM(config).save_pretrained(path)
+    return str(path)
+
+
+def test_build_prompt_matches_the_lambdas():
+    csv_prompt = build_prompt(RECORDS[0])
+    assert csv_prompt.startswith("### Instruction:\n")
+    assert "### Reddit Post:\nNailed it\n\n### Image Context:\n- Description:a cake\n\n### Response:\n" in csv_prompt
+
+    ddb_prompt = build_prompt(RECORDS[1])
+    assert "Found this sign\n\non my way to work" in ddb_prompt
+    # Rekognition lists are joined the same way the Lambdas join them
+    assert "- Description:a sign on a pole\n-Text:NO PARKING\n-Celebrities:Keanu Reeves, Tom Hanks\n\n" in ddb_prompt
+    assert ddb_prompt.endswith("### Response:\n")
+
+
+def test_fake_sagemaker_backend_writes_rows_and_resumes(tmp_path):
+    output_path = tmp_path / "generated.jsonl"
+    stats = asyncio.run(run(make_args(output_path), RECORDS[:2]))
+
+    rows = read_rows(output_path)
+    assert stats["errors"] == 0
+    assert sorted(row["submissionId"] for row in rows) == ["csv001", "ddb002"]
+    for row in rows:
+        assert row["generatedComment"] == "This is the funniest thing I've seen all day"
+        # token count comes from the TGI details the fake endpoint returns
+        assert row["generatedTokens"] == 9
+        assert row["latencySeconds"] >= 0
+    assert {row["submissionId"]: row["topComment"] for row in rows} == {"csv001": "Top", "ddb002": None}
+
+    # a rerun only generates what is missing from the output
+    done = completed_ids(output_path)
+    assert done == {"csv001", "ddb002"}
+    pending = [record for record in RECORDS if record["submissionId"] not in done]
+    asyncio.run(run(make_args(output_path), pending))
+    assert [row["submissionId"] for row in read_rows(output_path)][2:] == ["csv003"]
+    assert completed_ids(output_path) == {"csv001", "ddb002", "csv003"}
+
+
+def test_failed_requests_are_counted_not_written(tmp_path):
+    from services.fakes import LatencyProfile
+
+    async def generate():
+        backend = SageMakerBackend("endpoint", {"max_new_tokens": 8}, concurrency=1, fake=True)
+        async with backend:
+            backend.services.backend.profiles["sagemaker-runtime.llm"] = LatencyProfile(error_rate=1.0, error_code="ValidationError")
+            with open(tmp_path / "generated.jsonl", "a") as output_file:
+                return await generate_all(backend, RECORDS, output_file)
+
+    stats = asyncio.run(generate())
+    assert stats["errors"] == len(RECORDS)
+    assert completed_ids(tmp_path / "generated.jsonl") == set()
+
+
+def test_local_backend_generates_batches(tiny_model_dir, tmp_path):
+    output_path = tmp_path / "generated.jsonl"
+    args = make_args(output_path, backend="local", model_name_or_path=tiny_model_dir, batch_size=2)
+    stats = asyncio.run(run(args, RECORDS))
+
+    rows = read_rows(output_path)
+    assert stats["errors"] == 0
+    assert sorted(row["submissionId"] for row in rows) == ["csv001", "csv003", "ddb002"]
+    for row in rows:
+        assert isinstance(row["generatedComment"], str)
+        assert 1 <= row["generatedTokens"] <= args.max_new_tokens
+    assert stats["tokens"] == sum(row["generatedTokens"] for row in rows)
+    # the first two posts were generated in one left-padded batch, so they share a latency
+    latencies = {row["submissionId"]: row["latencySeconds"] for row in rows}
+    assert latencies["csv001"] == latencies["ddb002"]
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import zipfile
+import argparse
+import tempfile
+import subprocess
+from importlib import metadata
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from services.stage_metrics import percentile
+
+DIST_DIR = os.path.join(REPO_ROOT, "lambda_packaging", "dist")
+
+# Modules a full invocation loads, lazily or not. The handlers used to import them all at init.
+FIRST_USE_MODULES = ["boto3", "praw", "urllib.request", "PIL.Image"]
+
+# Runs in a fresh interpreter without site-packages, like /var/task + /var/runtime on Lambda
+PROBE = """
+import sys, time, json
+sys.path[:0] = [{package_dir!r}, {runtime_dir!r}]
+
+start = time.perf_counter()
+import lambda_function
+init = time.perf_counter() - start
+
+# What the first invocation still has to load. Handlers that imported boto3 at init also built
+# their DynamoDB resources there, so the resource is only counted for handlers that deferred it.
+deferred_boto3 = 'boto3' not in sys.modules
+start = time.perf_counter()
+for name in {modules!r}:
+    if name not in sys.modules:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+if deferred_boto3:
+    import boto3
+    boto3.resource('dynamodb').Table('cold-start-probe')
+first_use = time.perf_counter() - start
+
+print(json.dumps({{'init_ms': init * 1000, 'first_use_ms': first_use * 1000}}))
+"""
+
+
+def parse_args():
+    """Parse the arguments."""
+    parser = argparse.ArgumentParser(description="Measure module init and first-use import time of Lambda deployment packages.")
+    parser.add_argument(
+        "--packages",
+        type=str,
+        default=",".join(f"{name}={os.path.join(DIST_DIR, name + '.zip')}" for name in ["phase_i", "phase_ii", "enrichment"]),
+        help="Comma separated label=path.zip packages, as built by lambda_packaging/build_package.py.",
+    )
+    parser.add_argument("--runtime_dir", type=str, default=os.path.join(DIST_DIR, "runtime"), help="Folder holding boto3 as the Lambda runtime provides it, installed if missing.")
+    parser.add_argument("--boto3_version", type=str, default=None, help="boto3 version for the runtime folder, defaults to the installed one.")
+    parser.add_argument("--repeats", type=int, default=10, help="Cold starts measured per package.")
+    parser.add_argument("--top_imports", type=int, default=8, help="Slowest imports to list per package, from -X importtime.")
+    parser.add_argument("--output_json", type=str, default=None, help="Path to write the results as JSON.")
+    return parser.parse_args()
+
+
+def ensure_runtime(runtime_dir, boto3_version):
+    """Install boto3 into its own folder, with bytecode, the way the Lambda Python runtime ships it."""
+    if os.path.isdir(os.path.join(runtime_dir, "boto3")):
+        return
+    if boto3_version is None:
+        try:
+            boto3_version = metadata.version("boto3")
+        except metadata.PackageNotFoundError:
+            boto3_version = None
+    requirement = f"boto3=={boto3_version}" if boto3_version else "boto3"
+    subprocess.run([sys.executable, "-m", "pip", "install", "--quiet", "--target", runtime_dir, requirement], check=True)
+
+
+def probe_env():
+    env = {key: value for key, value in os.environ.items() if not key.startswith("PYTHON")}
+    # /var/task is read-only on Lambda, so nothing is cached between cold starts
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    return env
+
+
+def measure(package_dir, runtime_dir, repeats, top_imports):
+    code = PROBE.format(package_dir=package_dir, runtime_dir=runtime_dir, modules=FIRST_USE_MODULES)
+    samples = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-S", "-c", code], cwd=package_dir, env=probe_env(),
+                                capture_output=True, text=True, check=True)
+        samples.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    # one extra run with -X importtime for the breakdown of init plus first use
+    output = subprocess.run([sys.executable, "-S", "-X", "importtime", "-c", code], cwd=package_dir, env=probe_env(),
+                            capture_output=True, text=True, check=True)
+    imports = []
+    for line in output.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit() and not name.startswith("  "):
+                imports.append((name.strip(), int(cumulative) / 1000))
+    imports.sort(key=lambda item: -item[1])
+
+    init = [sample["init_ms"] for sample in samples]
+    first_use = [sample["first_use_ms"] for sample in samples]
+    total = [sample["init_ms"] + sample["first_use_ms"] for sample in samples]
+    return {
+        "init_ms": {"p50": percentile(init, 50), "p90": percentile(init, 90)},
+        "first_use_ms": {"p50": percentile(first_use, 50), "p90": percentile(first_use, 90)},
+        "total_ms": {"p50": percentile(total, 50), "p90": percentile(total, 90)},
+        "top_imports_ms": imports[:top_imports],
+    }
+
+
+def main():
+    args = parse_args()
+    ensure_runtime(args.runtime_dir, args.boto3_version)
+
+    results = {}
+    for entry in args.packages.split(","):
+        label, zip_path = entry.split("=", 1)
+        with tempfile.TemporaryDirectory() as package_dir:
+            with zipfile.ZipFile(zip_path) as zf:
+                zf.extractall(package_dir)
+                files = len(zf.namelist())
+            result = measure(package_dir, os.path.abspath(args.runtime_dir), args.repeats, args.top_imports)
+        result["zip_mb"] = os.path.getsize(zip_path) / 1e6
+        result["files"] = files
+        results[label] = result
+
+    print(f"{'package':<22}{'zip MB':>8}{'files':>7}{'init p50':>10}{'init p90':>10}{'first use p50':>15}{'total p50':>11}")
+    for label, result in results.items():
+        print(f"{label:<22}{result['zip_mb']:>8.1f}{result['files']:>7}{result['init_ms']['p50']:>10.0f}{result['init_ms']['p90']:>10.0f}"
+              f"{result['first_use_ms']['p50']:>15.0f}{result['total_ms']['p50']:>11.0f}")
+    for label, result in results.items():
+        print(f"\n{label} slowest imports over init and first use (ms): " + ", ".join(f"{name}={ms:.0f}" for name, ms in result["top_imports_ms"]))
+
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output_json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import io
+import os
+import sys
+import time
+import argparse
+
+from PIL import Image, ImageDraw, ImageFilter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from services.fakes import TEST_IMAGES_DIR
+from services.image_normalization import normalize_image, DEFAULT_MAX_EDGE, DEFAULT_JPEG_QUALITY
+from services.stage_metrics import percentile
+
+
+def parse_args():
+    """Parse the arguments."""
+    parser = argparse.ArgumentParser(description="Measure byte and latency savings of the image normalization stage.")
+    parser.add_argument("--max_edge", type=int, default=DEFAULT_MAX_EDGE, help="Longest edge after normalization.")
+    parser.add_argument("--quality", type=int, default=DEFAULT_JPEG_QUALITY, help="JPEG quality after normalization.")
+    parser.add_argument("--repeats", type=int, default=5, help="Normalization runs per image.")
+    parser.add_argument("--bandwidth_mbps", type=float, default=100.0, help="Bandwidth used to estimate transfer time.")
+    return parser.parse_args()
+
+
+def synthetic_photo(width, height, seed):
+    """Noisy photo-like image, compresses like a phone camera picture rather than a flat graphic."""
+    image = Image.effect_noise((width // 4, height // 4), 64).resize((width, height), Image.BICUBIC).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for i in range(12):
+        x, y = (seed * 97 + i * 331) % width, (seed * 53 + i * 211) % height
+        draw.ellipse([x, y, x + width // 5, y + height // 5], fill=((i * 40) % 256, (i * 90) % 256, (i * 150) % 256))
+    return image.filter(ImageFilter.GaussianBlur(1))
+
+
+def base64_size(num_bytes):
+    return 4 * ((num_bytes + 2) // 3)
+
+
+def encode(image, image_format, **kwargs):
+    output = io.BytesIO()
+    image.save(output, format=image_format, **kwargs)
+    return output.getvalue()
+
+
+def sample_images():
+    """The repo's test images plus synthetic phone photos and animated GIF/WebP posts."""
+    for name in sorted(os.listdir(TEST_IMAGES_DIR)):
+        with open(os.path.join(TEST_IMAGES_DIR, name), "rb") as f:
+            yield name, f.read()
+
+    yield "phone_photo_12mp.jpg", encode(synthetic_photo(4032, 3024, 1), "JPEG", quality=92)
+    yield "phone_photo_48mp.jpg", encode(synthetic_photo(8064, 6048, 2), "JPEG", quality=92)
+    yield "screenshot_portrait.png", encode(synthetic_photo(1290, 2796, 3), "PNG")
+
+    frames = [synthetic_photo(800, 600, seed).quantize(colors=128) for seed in range(10)]
+    yield "animated_10_frames.gif", encode(frames[0], "GIF", save_all=True, append_images=frames[1:], duration=100, loop=0)
+    frames = [synthetic_photo(1080, 1080, seed) for seed in range(10)]
+    yield "animated_10_frames.webp", encode(frames[0], "WEBP", save_all=True, append_images=frames[1:], duration=100, quality=80)
+
+
+def main():
+    args = parse_args()
+    bytes_per_second = args.bandwidth_mbps * 1e6 / 8
+
+    print(f"max edge {args.max_edge}px, JPEG quality {args.quality}, transfer time estimated at {args.bandwidth_mbps:g} Mbps "
+          f"(not measured, service latency is not included)\n")
+    print(f"{'image':<26}{'format':<7}{'source':>12}{'normalized':>12}{'source KB':>11}{'norm KB':>9}{'ratio':>7}"
+          f"{'p50 ms':>9}{'est. saved ms':>15}")
+
+    total_source, total_normalized, total_normalize_ms = 0, 0, 0.0
+    for name, image_bytes in sample_images():
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            normalized, info = normalize_image(image_bytes, max_edge=args.max_edge, quality=args.quality)
+            timings.append((time.perf_counter() - start) * 1000)
+        normalize_ms = percentile(timings, 50)
+        # Estimate only: every consumer (S3 upload, caption payload, Rekognition) moves the image once, and
+        # the caption payload now carries the normalized image inline as base64 (4/3 of its size)
+        bytes_before = len(image_bytes) * 3
+        bytes_after = len(normalized) * 2 + base64_size(len(normalized))
+        saved_ms = (bytes_before - bytes_after) / bytes_per_second * 1000 - normalize_ms
+
+        total_source += len(image_bytes)
+        total_normalized += len(normalized)
+        total_normalize_ms += normalize_ms
+        source_size = "x".join(map(str, info["sourceSize"]))
+        size = "x".join(map(str, info["size"]))
+        print(f"{name:<26}{info['sourceFormat']:<7}{source_size:>12}{size:>12}{len(image_bytes) / 1024:>11.0f}"
+              f"{len(normalized) / 1024:>9.0f}{len(image_bytes) / len(normalized):>7.1f}{normalize_ms:>9.1f}{saved_ms:>15.1f}")
+
+    print(f"\ntotal: {total_source / 1024:.0f} KB -> {total_normalized / 1024:.0f} KB "
+          f"({total_source / total_normalized:.1f}x smaller), {total_normalize_ms:.0f} ms spent normalizing")
+
+
+if __name__ == "__main__":
+    main()
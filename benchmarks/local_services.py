@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import threading
+import types
+
+from services.fakes import FakeBackend, LatencyProfile, TEST_IMAGES_DIR
+
+# Latency presets in seconds, keyed by "<service>.<operation>"
+PROFILES = {
+    "zero": {},
+    "realistic": {
+        "secretsmanager.get_secret_value": LatencyProfile(0.05, 0.02),
+        "reddit.listing": LatencyProfile(0.4, 0.1),
+        "reddit.submission": LatencyProfile(0.25, 0.05),
+        "reddit.reply": LatencyProfile(0.3, 0.1),
+        "dynamodb.get_item": LatencyProfile(0.008, 0.004),
+        "dynamodb.put_item": LatencyProfile(0.012, 0.004),
+        "dynamodb.update_item": LatencyProfile(0.012, 0.004),
+        "http.download": LatencyProfile(0.15, 0.1),
+        "s3.upload_file": LatencyProfile(0.08, 0.04),
+        "s3.put_object": LatencyProfile(0.08, 0.04),
+        "sagemaker-runtime.caption": LatencyProfile(0.6, 0.2),
+        "sagemaker-runtime.llm": LatencyProfile(2.5, 0.8),
+        "rekognition.recognize_celebrities": LatencyProfile(0.45, 0.15),
+        "rekognition.detect_text": LatencyProfile(0.35, 0.1),
+        "lambda.invoke": LatencyProfile(0.03, 0.01),
+    },
+}
+
+TITLES = [
+    "My dog when I say the word 'walk'",
+    "Found this sign on my way to work",
+    "Nailed it",
+    "Amazon delivery guy knows what's up",
+    "When the group project is due tomorrow",
+    "I asked for a simple haircut",
+]
+
+
+def load_profiles(preset="zero", profile_file=None, time_scale=1.0):
+    """Build latency profiles from a preset, overridden by a JSON file of {"op": {"mean", "jitter", "error_rate"}}."""
+    profiles = dict(PROFILES[preset])
+    if profile_file:
+        with open(profile_file) as f:
+            for operation, profile in json.load(f).items():
+                profiles[operation] = LatencyProfile(**profile)
+    return {
+        operation: LatencyProfile(p.mean * time_scale, p.jitter * time_scale, p.error_rate, p.error_code)
+        for operation, p in profiles.items()
+    }
+
+
+class LocalServices:
+    """
+    Synchronous in-process stand-ins for AWS, Reddit and image hosting, shared
+    by everything a benchmark run touches. Every call sleeps for its latency
+    profile, fails with a ClientError at its error rate and is counted in `calls`.
+
+    Latencies, errors and the endpoint and Rekognition responses come from a
+    services.fakes.FakeBackend, so the sync and async fakes answer alike.
+    """
+
+    def __init__(self, profiles=None, images_dir=TEST_IMAGES_DIR, num_submissions=100, seed=0):
+        self.backend = FakeBackend(
+            profiles=profiles,
+            images_dir=images_dir,
+            caption="an image of a dog wearing sunglasses",
+            celebrities=["Keanu Reeves"],
+            detected_texts=["DRIVE NEXT"],
+            seed=seed,
+        )
+        self.images_dir = images_dir
+        self.images = self.backend.images
+        self.rng = self.backend.rng
+        self.lock = threading.Lock()
+        self.calls = self.backend.calls
+        self.errors = self.backend.errors
+        self.tables = {}
+        self.objects = self.backend.objects
+        self.replies = []
+        self.invocations = []
+        self.image_paths = {}
+        # per-container services.aws client cache, swapped in by the benchmark while this container runs
+        self.aws_clients = {}
+        self.submissions = [self.make_submission(i) for i in range(num_submissions)]
+        self.submissions_by_id = {s.id: s for s in self.submissions}
+
+    def make_submission(self, i):
+        """Synthetic image post, cycling through the test images."""
+        image = self.images[i % len(self.images)]
+        url = f"https://i.redd.it/bench{i:05d}{os.path.splitext(image)[1]}"
+        self.image_paths[url] = os.path.join(self.images_dir, image)
+        return FakeSubmission(self, id=f"bench{i:05d}", title=self.rng.choice(TITLES), selftext="", url=url)
+
+    def image_for_url(self, url):
+        if url in self.image_paths:
+            return self.image_paths[url]
+        return os.path.join(self.images_dir, self.images[sum(url.encode()) % len(self.images)])
+
+    def simulate(self, operation):
+        with self.lock:
+            latency, error = self.backend.draw(operation)
+        time.sleep(latency)
+        if error is not None:
+            raise error
+
+    def urlopen(self, url, timeout=None):
+        self.simulate("http.download")
+        return open(self.image_for_url(url), "rb")
+
+    def boto3_module(self):
+        """Module-like object that replaces boto3."""
+        services = self
+        module = types.ModuleType("boto3")
+        module.client = lambda service_name, **kwargs: FakeClient(services, service_name)
+        module.resource = lambda service_name, **kwargs: FakeDynamoResource(services)
+        session_module = types.ModuleType("boto3.session")
+        session_module.Session = lambda **kwargs: types.SimpleNamespace(
+            client=lambda service_name, **kwargs: FakeClient(services, service_name)
+        )
+        module.session = session_module
+        return module
+
+    def praw_module(self):
+        """Module-like object that replaces praw."""
+        services = self
+        module = types.ModuleType("praw")
+        module.Reddit = lambda **kwargs: FakeReddit(services)
+        return module
+
+
+class FakeBody:
+    def __init__(self, content):
+        self.content = content
+
+    def read(self):
+        return self.content
+
+
+class FakeClient:
+    def __init__(self, services, service_name):
+        self.services = services
+        self.service_name = service_name
+
+    def get_secret_value(self, SecretId):
+        self.services.simulate("secretsmanager.get_secret_value")
+        secret = {"client_id": "id", "client_secret": "secret", "user_password": "password",
+                  "user_agent": "benchmark", "username": "benchmark"}
+        return {"SecretString": json.dumps(secret)}
+
+    def invoke_endpoint(self, EndpointName, Body, **kwargs):
+        operation, content = self.services.backend.endpoint_response(json.loads(Body))
+        self.services.simulate(operation)
+        return {"Body": FakeBody(content.encode())}
+
+    def recognize_celebrities(self, Image, **kwargs):
+        self.services.simulate("rekognition.recognize_celebrities")
+        return self.services.backend.celebrities_response()
+
+    def detect_text(self, Image, **kwargs):
+        self.services.simulate("rekognition.detect_text")
+        return self.services.backend.text_response()
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        self.services.simulate("s3.upload_file")
+        with open(Filename, "rb") as f:
+            self.services.objects[(Bucket, Key)] = f.read()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.services.simulate("s3.put_object")
+        self.services.objects[(Bucket, Key)] = Body
+        return {}
+
+    def invoke(self, FunctionName, InvocationType, Payload, **kwargs):
+        self.services.simulate("lambda.invoke")
+        self.services.invocations.append((FunctionName, json.loads(Payload)))
+        return {"StatusCode": 202}
+
+
+class FakeDynamoResource:
+    def __init__(self, services):
+        self.services = services
+
+    def Table(self, name):
+        return FakeTable(self.services, self.services.tables.setdefault(name, {}))
+
+
+class FakeTable:
+    def __init__(self, services, items):
+        self.services = services
+        self.items = items
+
+    @staticmethod
+    def item_key(Key):
+        return tuple(sorted(Key.items()))
+
+    def get_item(self, Key, **kwargs):
+        self.services.simulate("dynamodb.get_item")
+        item = self.items.get(self.item_key(Key))
+        return {"Item": dict(item)} if item is not None else {}
+
+    def put_item(self, Item, **kwargs):
+        self.services.simulate("dynamodb.put_item")
+        # the first attribute of every item in this repo is its partition key
+        key_name = next(iter(Item))
+        self.items[self.item_key({key_name: Item[key_name]})] = dict(Item)
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        self.services.simulate("dynamodb.delete_item")
+        self.items.pop(self.item_key(Key), None)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, ExpressionAttributeNames=None, **kwargs):
+        self.services.simulate("dynamodb.update_item")
+        item = self.items.setdefault(self.item_key(Key), dict(Key))
+        # only "SET a = :x, #b = :y" expressions are used in this repo
+        for assignment in UpdateExpression.strip()[len("SET"):].split(","):
+            name, value = (part.strip() for part in assignment.split("="))
+            name = (ExpressionAttributeNames or {}).get(name, name)
+            item[name] = ExpressionAttributeValues[value]
+        return {"Attributes": dict(item)}
+
+
+class FakeSubreddit:
+    def __init__(self, services):
+        self.services = services
+
+    def top(self, time_filter="all", limit=None):
+        self.services.simulate("reddit.listing")
+        return iter(self.services.submissions[:limit])
+
+
+class FakeReddit:
+    def __init__(self, services):
+        self.services = services
+
+    def subreddit(self, name):
+        return FakeSubreddit(self.services)
+
+    def submission(self, id):
+        self.services.simulate("reddit.submission")
+        return self.services.submissions_by_id[id]
+
+
+class FakeSubmission:
+    def __init__(self, services, id, title, selftext, url):
+        self.services = services
+        self.id = id
+        self.title = title
+        self.selftext = selftext
+        self.url = url
+
+    def reply(self, body):
+        self.services.simulate("reddit.reply")
+        self.services.replies.append((self.id, body))
@@ -0,0 +1,257 @@
+import io
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import contextlib
+import importlib.util
+import urllib.request
+from collections import Counter, defaultdict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from services import aws
+from services.stage_metrics import StageMetrics, percentile
+from benchmarks.local_services import LocalServices, PROFILES, load_profiles
+
+HANDLERS = {
+    "phase_i": os.path.join(REPO_ROOT, "deployment_phase_i", "lambda_function.py"),
+    "phase_ii": os.path.join(REPO_ROOT, "deployment_phase_ii", "lambda_function.py"),
+    "enrichment": os.path.join(REPO_ROOT, "data_enrichment_and_preparation", "lambda_function.py"),
+}
+
+# SQS batch size of the enrichment Lambda trigger
+ENRICHMENT_BATCH_SIZE = 10
+
+
+def parse_args():
+    """Parse the arguments."""
+    parser = argparse.ArgumentParser(description="Offline end-to-end throughput benchmark of the Lambda handlers.")
+    parser.add_argument("--num_submissions", type=int, default=50, help="Number of synthetic submissions in the listing.")
+    parser.add_argument("--profile", type=str, default="zero", choices=sorted(PROFILES), help="Latency preset of the local services.")
+    parser.add_argument("--profile_file", type=str, default=None, help='JSON file of {"<service>.<operation>": {"mean": s, "jitter": s, "error_rate": p}} overrides.')
+    parser.add_argument("--time_scale", type=float, default=1.0, help="Multiplier applied to every simulated latency.")
+    parser.add_argument("--scenarios", type=str, default="phase_i,phase_i_cached,phase_ii,phase_ii_repeat,enrichment", help="Comma separated scenarios to run.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latencies, errors and the synthetic listing.")
+    parser.add_argument("--output_json", type=str, default=None, help="Path to write the results as JSON.")
+    parser.add_argument("--baseline", type=str, default=None, help="Results JSON of a previous run to check for regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative slowdown against the baseline.")
+    parser.add_argument("--min_regression_ms", type=float, default=1.0, help="Slowdowns smaller than this, per stage or per post, are noise and never regressions.")
+    return parser.parse_args()
+
+
+class CollectingStageMetrics(StageMetrics):
+    """StageMetrics that keeps emitted invocations in memory instead of printing EMF lines."""
+
+    emitted = []
+
+    def emit(self):
+        CollectingStageMetrics.emitted.append(self)
+
+
+@contextlib.contextmanager
+def local_environment(services):
+    """Route boto3, praw and urlopen to the local services while the handlers are loaded and run."""
+    fakes = {"boto3": services.boto3_module(), "praw": services.praw_module()}
+    fakes["boto3.session"] = fakes["boto3"].session
+    saved_modules = {name: sys.modules.get(name) for name in fakes}
+    saved_urlopen = urllib.request.urlopen
+    saved_aws_clients = aws.aws_clients
+    sys.modules.update(fakes)
+    urllib.request.urlopen = services.urlopen
+    # the handlers share services.aws in this process, so each simulated container gets its own clients
+    aws.aws_clients = services.aws_clients
+    try:
+        yield
+    finally:
+        aws.aws_clients = saved_aws_clients
+        urllib.request.urlopen = saved_urlopen
+        for name, module in saved_modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+
+def load_handler(name, services):
+    """Import a handler module under a unique name, wired to the local services."""
+    spec = importlib.util.spec_from_file_location(f"benchmark_{name}_lambda_function", HANDLERS[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # handlers import boto3, praw and urlopen on first use, which local_environment routes to the local services
+    module.StageMetrics = CollectingStageMetrics
+    return module
+
+
+def lambda_context(name):
+    return types.SimpleNamespace(
+        function_name=f"benchmark-{name}",
+        invoked_function_arn=f"arn:aws:lambda:us-east-1:000000000000:function:benchmark-{name}",
+        aws_request_id="benchmark",
+    )
+
+
+def phase_i_events(services):
+    for submission in services.submissions:
+        post_url = f"https://www.reddit.com/r/funny/comments/{submission.id}/benchmark_post/"
+        yield {"body": json.dumps({"post_url": post_url})}
+
+
+def phase_ii_events(services):
+    yield {}
+
+
+def enrichment_events(services):
+    records = [{"body": f"reddit/funny/posts/{submission.id}.png"} for submission in services.submissions]
+    for i in range(0, len(records), ENRICHMENT_BATCH_SIZE):
+        yield {"Records": records[i:i + ENRICHMENT_BATCH_SIZE]}
+
+
+# scenario -> (handler, events), scenarios of the same handler run in order against the same warm module
+SCENARIOS = {
+    "phase_i": ("phase_i", phase_i_events),
+    "phase_i_cached": ("phase_i", phase_i_events),
+    "phase_ii": ("phase_ii", phase_ii_events),
+    "phase_ii_repeat": ("phase_ii", phase_ii_events),
+    "enrichment": ("enrichment", enrichment_events),
+}
+
+
+def run_scenario(scenario, module, services):
+    """Invoke a handler for every event of a scenario and summarize throughput, stages and service calls."""
+    handler_name, events = SCENARIOS[scenario]
+    context = lambda_context(handler_name)
+    calls_before = Counter(services.calls)
+    CollectingStageMetrics.emitted = []
+    status_codes = Counter()
+    invocation_errors = 0
+
+    start = time.perf_counter()
+    invocations = 0
+    for event in events(services):
+        # handlers behind SQS (enrichment) raise so the batch is redelivered; count that and keep going
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = module.lambda_handler(event, context)
+            status_codes[str((result or {}).get("statusCode", "none"))] += 1
+        except Exception:
+            status_codes["error"] += 1
+            invocation_errors += 1
+        invocations += 1
+    wall_time = time.perf_counter() - start
+
+    stage_durations = defaultdict(list)
+    counters = Counter()
+    if invocation_errors:
+        counters["invocationErrors"] = invocation_errors
+    for metrics in CollectingStageMetrics.emitted:
+        for stage, values in metrics.durations.items():
+            stage_durations[stage].extend(values)
+        counters.update(metrics.counters)
+        for cache, (hits, misses) in metrics.caches.items():
+            counters[f"{cache}Hits"] += hits
+            counters[f"{cache}Misses"] += misses
+
+    posts = len(services.submissions)
+    return {
+        "scenario": scenario,
+        "invocations": invocations,
+        "posts": posts,
+        "wall_time_s": wall_time,
+        "posts_per_second": posts / wall_time if wall_time > 0 else None,
+        "status_codes": dict(status_codes),
+        "stages_ms": {
+            stage: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            }
+            for stage, values in stage_durations.items()
+        },
+        "counters": dict(counters),
+        "service_calls": dict(Counter(services.calls) - calls_before),
+    }
+
+
+def print_result(result):
+    print(f"\n=== {result['scenario']} ===")
+    print(f"{result['posts']} posts in {result['invocations']} invocations, {result['wall_time_s']:.3f} s "
+          f"-> {result['posts_per_second']:.2f} posts/s || status codes: {result['status_codes']}")
+    print(f"{'stage':<24}{'count':>7}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    for stage, stats in sorted(result["stages_ms"].items(), key=lambda item: -item[1]["p50"] * item[1]["count"]):
+        print(f"{stage:<24}{stats['count']:>7}{stats['p50']:>11.2f}{stats['p90']:>11.2f}{stats['p99']:>11.2f}{stats['max']:>11.2f}")
+    print("service calls: " + ", ".join(f"{op}={count}" for op, count in sorted(result["service_calls"].items())))
+    if result["counters"]:
+        print("counters: " + ", ".join(f"{name}={value}" for name, value in sorted(result["counters"].items())))
+
+
+def check_regressions(results, baseline, tolerance, min_regression_ms=1.0):
+    """
+    Compare posts/s and stage p50/p99 against a baseline run, returning a list of regressions.
+
+    A slowdown must exceed both the relative `tolerance` and `min_regression_ms`, so sub-millisecond
+    stages (e.g. every stage under the zero profile) don't fail on scheduling noise.
+    """
+    baseline = {result["scenario"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = baseline.get(result["scenario"])
+        if base is None:
+            continue
+        # compared as time per post for the absolute floor
+        slowdown_ms = 1000 / result["posts_per_second"] - 1000 / base["posts_per_second"]
+        if result["posts_per_second"] < base["posts_per_second"] * (1 - tolerance) and slowdown_ms > min_regression_ms:
+            regressions.append(f"{result['scenario']}: posts/s {base['posts_per_second']:.2f} -> {result['posts_per_second']:.2f}")
+        for stage, stats in result["stages_ms"].items():
+            base_stats = base["stages_ms"].get(stage)
+            if base_stats is None:
+                continue
+            for key in ("p50", "p99"):
+                if stats[key] > base_stats[key] * (1 + tolerance) and stats[key] - base_stats[key] > min_regression_ms:
+                    regressions.append(f"{result['scenario']}.{stage}: {key} {base_stats[key]:.2f} ms -> {stats[key]:.2f} ms")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    profiles = load_profiles(args.profile, args.profile_file, args.time_scale)
+
+    results = []
+    handler_state = {}
+    for scenario in args.scenarios.split(","):
+        handler_name, _ = SCENARIOS[scenario]
+        # scenarios of the same handler share one set of local services and one loaded module (warm container)
+        if handler_name not in handler_state:
+            services = LocalServices(profiles, num_submissions=args.num_submissions, seed=args.seed)
+            with local_environment(services):
+                handler_state[handler_name] = (load_handler(handler_name, services), services)
+        module, services = handler_state[handler_name]
+        with local_environment(services):
+            result = run_scenario(scenario, module, services)
+        print_result(result)
+        results.append(result)
+
+    output = {"config": vars(args), "results": results}
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nResults written to {args.output_json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = check_regressions(results, json.load(f), args.tolerance, args.min_regression_ms)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for regression in regressions:
+                print(f"- {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import re
+import json
+import zlib
+import argparse
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+# Mersenne prime used for the universal hash family h(x) = (a * x + b) mod p
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+# Labels added by the image context formatting, shared by every row so they are stripped before shingling
+CONTEXT_LABELS = re.compile(r"-\s*(description|text|celebrities)\s*:", re.IGNORECASE)
+
+
+def parse_args():
+    """Parse the arguments."""
+    parser = argparse.ArgumentParser(description="Remove near-duplicate posts from the training data using MinHash/LSH.")
+    parser.add_argument("--input_path", type=str, default="training_data.csv", help="Path to the training data csv.")
+    parser.add_argument("--output_path", type=str, default="training_data_deduped.csv", help="Path to write the deduplicated csv.")
+    parser.add_argument("--report_path", type=str, default="dedupe_report.jsonl", help="Path to write the duplicate cluster report.")
+    parser.add_argument(
+        "--columns",
+        type=str,
+        default="title,image_description,topComment",
+        help="Comma separated columns that make up a post's text.",
+    )
+    parser.add_argument("--id_column", type=str, default="submissionId", help="Column with the post ID.")
+    parser.add_argument(
+        "--score_column",
+        type=str,
+        default=None,
+        help="Optional column (e.g. 'score') used to keep the highest scoring post of each cluster. Defaults to the first post.",
+    )
+    parser.add_argument("--threshold", type=float, default=0.7, help="Estimated Jaccard similarity to count as a duplicate.")
+    parser.add_argument("--num_perm", type=int, default=128, help="Number of MinHash permutations.")
+    parser.add_argument("--shingle_size", type=int, default=5, help="Character shingle size.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the MinHash permutations.")
+    return parser.parse_args()
+
+
+def normalize_text(text):
+    """Lowercase, drop context labels and punctuation, and collapse whitespace."""
+    text = CONTEXT_LABELS.sub(" ", str(text).lower())
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def shingle_hashes(text, shingle_size):
+    """Hash the set of character shingles of a text to 32 bit integers."""
+    if len(text) <= shingle_size:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + shingle_size] for i in range(len(text) - shingle_size + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def init_permutations(num_perm, seed):
+    """Draw the (a, b) coefficients of the MinHash permutations."""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash_signature(hashes, a, b):
+    """MinHash signature of a set of shingle hashes, one value per permutation."""
+    # (num_shingles, 1) x (num_perm,) -> (num_shingles, num_perm), overflow wraps like the reference implementation
+    permuted = (hashes[:, None] * a + b) % MERSENNE_PRIME & MAX_HASH
+    return permuted.min(axis=0)
+
+
+def choose_bands(num_perm, threshold):
+    """Pick (bands, rows) with bands * rows == num_perm whose S-curve threshold is closest to `threshold`."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        curve_threshold = (1.0 / bands) ** (1.0 / rows)
+        if best is None or abs(curve_threshold - threshold) < abs(best[2] - threshold):
+            best = (bands, rows, curve_threshold)
+    return best[0], best[1]
+
+
+class UnionFind:
+    """Disjoint sets over row positions, used to merge duplicate pairs into clusters."""
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x, y):
+        root_x, root_y = self.find(x), self.find(y)
+        if root_x != root_y:
+            self.parent[max(root_x, root_y)] = min(root_x, root_y)
+
+
+def find_duplicate_clusters(texts, threshold=0.7, num_perm=128, shingle_size=5, seed=42):
+    """
+    Group near-duplicate texts with MinHash/LSH.
+
+    Every text gets a MinHash signature, the signature is split into bands and
+    each band is hashed into a bucket. Within a bucket, members are only compared
+    to the bucket's first member, so the work stays linear in the number of texts
+    even for heavily reposted content; transitivity through union-find recovers
+    the full clusters. Candidates are kept if their estimated Jaccard similarity
+    is at least `threshold`.
+
+    Returns a list of clusters (lists of row positions, size > 1) and a dict of
+    the similarity of each merged row to the row it was matched with.
+    """
+    a, b = init_permutations(num_perm, seed)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        signatures[i] = minhash_signature(shingle_hashes(normalize_text(text), shingle_size), a, b)
+
+    bands, rows = choose_bands(num_perm, threshold)
+    print(f"MinHash/LSH with {bands} bands x {rows} rows (S-curve threshold {(1.0 / bands) ** (1.0 / rows):.2f})")
+
+    union_find = UnionFind(len(texts))
+    similarities = {}
+    for band in range(bands):
+        # view each band as one opaque value so identical bands share a bucket id
+        band_signatures = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        band_keys = band_signatures.view(np.dtype((np.void, band_signatures.dtype.itemsize * rows))).ravel()
+        _, bucket_ids, bucket_sizes = np.unique(band_keys, return_inverse=True, return_counts=True)
+
+        # only rows that landed in a bucket with other rows are candidates, in input order per bucket
+        candidates = np.flatnonzero(bucket_sizes[bucket_ids] > 1)
+        candidates = candidates[np.argsort(bucket_ids[candidates], kind="stable")]
+        buckets = np.split(candidates, np.flatnonzero(np.diff(bucket_ids[candidates])) + 1)
+
+        for members in buckets:
+            if len(members) < 2:
+                continue
+            members = members.tolist()
+            first = members[0]
+            for other in members[1:]:
+                if union_find.find(first) == union_find.find(other):
+                    continue
+                similarity = float(np.mean(signatures[first] == signatures[other]))
+                if similarity >= threshold:
+                    union_find.union(first, other)
+                    similarities[other] = max(similarity, similarities.get(other, 0.0))
+
+    clusters = defaultdict(list)
+    for i in range(len(texts)):
+        clusters[union_find.find(i)].append(i)
+    return [members for members in clusters.values() if len(members) > 1], similarities
+
+
+def dedupe_dataframe(df, columns, id_column="submissionId", score_column=None, **minhash_kwargs):
+    """Drop near-duplicate rows of `df`, keeping one post per cluster. Returns the deduplicated frame and a cluster report."""
+    texts = df[columns].fillna("").astype(str).agg("\n".join, axis=1).tolist()
+    clusters, similarities = find_duplicate_clusters(texts, **minhash_kwargs)
+
+    drop_positions = set()
+    report = []
+    for cluster_id, members in enumerate(clusters):
+        if score_column:
+            keep = max(members, key=lambda i: (df[score_column].iloc[i], -i))
+        else:
+            keep = min(members)
+        drop_positions.update(i for i in members if i != keep)
+        report.append({
+            "cluster_id": cluster_id,
+            "size": len(members),
+            "kept": str(df[id_column].iloc[keep]),
+            "dropped": [str(df[id_column].iloc[i]) for i in members if i != keep],
+            "members": [
+                {
+                    "id": str(df[id_column].iloc[i]),
+                    "title": str(df[columns[0]].iloc[i]),
+                    "similarity": similarities.get(i),
+                }
+                for i in members
+            ],
+        })
+
+    keep_mask = np.ones(len(df), dtype=bool)
+    keep_mask[list(drop_positions)] = False
+    return df[keep_mask], report
+
+
+def main():
+    args = parse_args()
+    columns = args.columns.split(",")
+
+    # training_data.csv is written with the pandas index as its first column
+    df = pd.read_csv(args.input_path, index_col=0)
+    deduped_df, report = dedupe_dataframe(
+        df,
+        columns,
+        id_column=args.id_column,
+        score_column=args.score_column,
+        threshold=args.threshold,
+        num_perm=args.num_perm,
+        shingle_size=args.shingle_size,
+        seed=args.seed,
+    )
+
+    deduped_df.reset_index(drop=True).to_csv(args.output_path)
+    with open(args.report_path, "w") as f:
+        for cluster in sorted(report, key=lambda c: c["size"], reverse=True):
+            f.write(json.dumps(cluster) + "\n")
+
+    print(f"Posts: {len(df)} || Duplicate clusters: {len(report)} || Dropped: {len(df) - len(deduped_df)} || Kept: {len(deduped_df)}")
+    print(f"Deduplicated data written to {args.output_path}, cluster report written to {args.report_path}")
+
+
+if __name__ == "__main__":
+    main()
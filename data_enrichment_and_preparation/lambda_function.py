@@ -1,34 +1,48 @@
-import boto3
 import json
 
-# Initialize the DynamoDB and Rekognition clients
-dynamodb = boto3.resource('dynamodb')
-rekognition = boto3.client('rekognition')
+from services.stage_metrics import StageMetrics
+from services.aws import get_client, get_table
 
 # Reference your DynamoDB table
-table = dynamodb.Table('funny-reddit-posts')
+table_name = 'funny-reddit-posts'
+
 
 def lambda_handler(event, context):
-    for record in event['Records']:
-        object_key = record['body']  # Example object key: 'reddit/funny/posts/16ok566.jpg'
-        bucket_name = 'your-bucket-name'  # Your S3 bucket name
+    metrics = StageMetrics('data-enrichment')
+    try:
+        for record in event['Records']:
+            enrich_record(record, metrics)
+            metrics.count('recordsProcessed')
+    finally:
+        metrics.emit()
+
+
+def enrich_record(record, metrics):
+    object_key = record['body']  # Example object key: 'reddit/funny/posts/16ok566.jpg'
+    bucket_name = 'your-bucket-name'  # Your S3 bucket name
 
-        # Extract submissionId using the helper function
-        submissionId = extract_submission_id(object_key)
+    # Extract submissionId using the helper function
+    submissionId = extract_submission_id(object_key)
 
+    rekognition = get_client('rekognition')
+    table = get_table(table_name)
+
+    # one 'rekognition' span over both calls, as in phase I and II
+    with metrics.stage('rekognition'):
         # Call Rekognition for Celebrity Recognition
         celebrity_response = rekognition.recognize_celebrities(
             Image={'S3Object': {'Bucket': bucket_name, 'Name': object_key}}
         )
-        celebrities = [celeb['Name'] for celeb in celebrity_response['CelebrityFaces']]
-        
+
         # Call Rekognition for Text Detection
         text_response = rekognition.detect_text(
             Image={'S3Object': {'Bucket': bucket_name, 'Name': object_key}}
         )
-        detected_texts = [text['DetectedText'] for text in text_response['TextDetections']]
+    celebrities = [celeb['Name'] for celeb in celebrity_response['CelebrityFaces']]
+    detected_texts = [text['DetectedText'] for text in text_response['TextDetections']]
 
-        # Update the DynamoDB item with celebrity and text recognition data
+    # Update the DynamoDB item with celebrity and text recognition data
+    with metrics.stage('dynamodbUpdate'):
         response = table.update_item(
             Key={'submissionId': submissionId},
             UpdateExpression="SET celebrityRekognition = :celebrities, textRekognition = :texts",
@@ -38,8 +52,9 @@ def lambda_handler(event, context):
             },
             ReturnValues="UPDATED_NEW"
         )
-        
-        print(f"Updated DynamoDB item for submissionId {submissionId}")
+    
+    print(f"Updated DynamoDB item for submissionId {submissionId}")
+
 
 def extract_submission_id(object_key):
     # Split the object key to isolate '16ok566.jpg' and then remove the '.jpg'
@@ -1,4 +1,6 @@
 
+import io
+import base64
 import requests
 from PIL import Image
 from transformers import BlipProcessor, BlipForConditionalGeneration
@@ -17,24 +19,33 @@ def predict_fn(data, model_and_processor):
     
     # For debugging
     print(f"Received data type: {type(data)}")
-    print(f"Received data content: {data}")
+    # Leave out base64 image payloads, they would flood the logs
+    if isinstance(data.get('inputs'), dict) and 'image' in data['inputs']:
+        logged_inputs = dict(data['inputs'], image=f"<{len(data['inputs']['image'])} base64 chars>")
+        print(f"Received data content: {{'inputs': {logged_inputs}}}")
+    else:
+        print(f"Received data content: {data}")
     
     # Check if 'inputs' key exists in the dictionary
     if 'inputs' in data:
         inputs = data['inputs']
-        # Extract 'img_url' and 'text'
+        # Extract 'img_url' (or the base64 encoded 'image') and 'text'
         img_url = inputs.get('img_url')
+        image = inputs.get('image')
         text = inputs.get('text')
         max_new_tokens = inputs.get('max_new_tokens', 20)
         skip_special_tokens = inputs.get('skip_special_tokens', True) 
-        # Raise error if 'img_url' is missing
-        if img_url is None:
-            raise ValueError("Dictionary is missing 'img_url' key. It should be formatted as {'inputs' : {'img_url' : '<URL>', 'text': '<Text>' }}")
+        # Raise error if both 'img_url' and 'image' are missing
+        if img_url is None and image is None:
+            raise ValueError("Dictionary is missing 'img_url' or 'image' key. It should be formatted as {'inputs' : {'img_url' : '<URL>', 'text': '<Text>' }}")
     else:
         raise ValueError("Dictionary is missing 'inputs' key. It should be formatted as {'inputs' : {'img_url' : '<URL>', 'text': '<Text>' }}")
     
-    # Load the image
-    raw_image = Image.open(requests.get(img_url, stream=True).raw).convert('RGB')
+    # Load the image, preferring the normalized bytes sent by the pipeline over downloading the original
+    if image is not None:
+        raw_image = Image.open(io.BytesIO(base64.b64decode(image))).convert('RGB')
+    else:
+        raw_image = Image.open(requests.get(img_url, stream=True).raw).convert('RGB')
 
     # Conditional image captioning
     if text:
@@ -1,77 +1,116 @@
 import os
-import io
 import json
-import boto3
-import praw
-from botocore.exceptions import ClientError
-from urllib.request import urlretrieve
+import math
+import base64
+import time
+import uuid
+from collections import OrderedDict
 
+from services.stage_metrics import StageMetrics
+from services.aws import get_client, get_table
+from services.image_normalization import prepare_image, is_image_url
+from services.prompts import initialize_prompt, format_image_context, finalize_prompt
 
-def lambda_handler(event, context):
-    
-    try:
-    
-        bucket_name = 'sagemaker-us-east-1-513033806411'
-        
-        blip_endpoint_name = "huggingface-pytorch-inference-2024-03-08-16-01-37-935"
-        llm_endpoint_name = "huggingface-pytorch-tgi-inference-2024-03-08-17-46-49-268"
+bucket_name = 'sagemaker-us-east-1-513033806411'
 
-        # Initialize Reddit Client
-        reddit = initialize_reddit_client()
-        
-        # Extract post URL from the Lambda event
-        body = json.loads(event.get('body', '{}'))
-        post_url = body['post_url']
+blip_endpoint_name = "huggingface-pytorch-inference-2024-03-08-16-01-37-935"
+llm_endpoint_name = "huggingface-pytorch-tgi-inference-2024-03-08-17-46-49-268"
 
-        # Extracting the post ID from the URL
-        post_id = post_url.split('/')[-3]
+# Cached comments and async jobs are stored in the same table, keyed by "post#<id>" and "job#<id>",
+# with DynamoDB TTL enabled on the expiresAt attribute
+results_table_name = 'laughgen-comment-results'
 
-        # Use PRAW to get the submission object
-        submission = reddit.submission(id=post_id)
+CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', 24 * 60 * 60))
+# most recently used posts kept in memory per container, DynamoDB holds the rest
+LOCAL_CACHE_MAX_ENTRIES = int(os.environ.get('LOCAL_CACHE_MAX_ENTRIES', 1000))
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 60 * 60))
+# stay under API Gateway's 29 second integration timeout
+MAX_LONG_POLL_SECONDS = 25
+LONG_POLL_INTERVAL_SECONDS = 0.5
 
-        # Initialize response dictionary
-        response = {
-            "id": submission.id,
-            "title": submission.title,
-            "body": submission.selftext,
-            "url": submission.url
-        }
-        
-        prompt = initialize_prompt(response)
+ASYNC_JOB_SOURCE = 'laughgen.async_job'
+JOB_PENDING = 'pending'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
 
-        # If there is an image, process it
-        if submission.url.endswith(('.jpg', '.png', '.jpeg')):
+# Per-container LRU cache of post_id -> (response, expiresAt), survives across warm invocations
+local_cache = OrderedDict()
 
-            # Download the image to a temporary location
-            image_path = download_image(submission.id, submission.url)
 
-            # Upload the image to S3
-            object_key = upload_image_to_s3(bucket_name, image_path)
+def lambda_handler(event, context):
 
-            # Generate an image caption using the BLIP model
-            image_caption = generate_image_caption(blip_endpoint_name, submission.url)
-            celebrities, detected_texts = get_celebrity_text(bucket_name, object_key)
-            
-        else:
-            image_caption, celebrities, detected_texts = ('','','')
-            
-        # format image context
-        image_context = format_image_context(image_caption, celebrities, detected_texts)
+    metrics = StageMetrics('phase-i')
     
-        #finalize prompt
-        final_prompt = finalize_prompt(prompt, image_context)
+    try:
+
+        # Background generation for a job started in async mode
+        if event.get('source') == ASYNC_JOB_SOURCE:
+            metrics.count('jobsRun')
+            run_job(event['job_id'], event['post_id'], metrics)
+            return {'statusCode': 200}
+
+        # Poll for the result of an async job, via GET ?job_id=... or a body with job_id
+        query = event.get('queryStringParameters') or {}
+        body = json.loads(event.get('body') or '{}')
+        job_id = query.get('job_id') or body.get('job_id')
+        if job_id:
+            try:
+                wait_seconds = float(query.get('wait', body.get('wait', 0)))
+                if not math.isfinite(wait_seconds):
+                    raise ValueError(wait_seconds)
+            except (TypeError, ValueError):
+                metrics.count('clientErrors')
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json'},
+                    'body': json.dumps({'error': 'wait must be a number of seconds'})
+                }
+            metrics.count('jobPolls')
+            with metrics.stage('poll'):
+                return poll_job(job_id, max(wait_seconds, 0))
+
+        # Extract post URL from the Lambda event
+        post_url = body['post_url']
+
+        # Extracting the post ID from the URL
+        post_id = post_url.split('/')[-3]
 
-        # Get a response from the Llama2 model using the post title and image caption
-        llama_response = get_llama_response(llm_endpoint_name, final_prompt)
+        # Return the cached comment if this post was generated recently
+        with metrics.stage('cacheLookup'):
+            cached_response = get_cached_response(post_id, metrics)
+        metrics.record_cache('resultCache', hit=cached_response is not None)
+        if cached_response is not None:
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'X-Cache': 'HIT'},
+                'body': json.dumps(cached_response)
+            }
+
+        # Async mode: return a job ID right away and generate in the background
+        if body.get('async'):
+            metrics.count('jobsStarted')
+            with metrics.stage('startJob'):
+                job_id = start_job(post_id, context)
+            return {
+                'statusCode': 202,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'job_id': job_id, 'status': JOB_PENDING})
+            }
+
+        llama_response = generate_comment(post_id, metrics)
+        with metrics.stage('cacheWrite'):
+            cache_response(post_id, llama_response, metrics)
 
         # Return the response
         return {
             'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'X-Cache': 'MISS'},
             'body': json.dumps(llama_response)
         }
         
     except KeyError as e:
         # Return an error if 'post_url' is not found in the body
+        metrics.count('clientErrors')
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json'},
@@ -79,6 +118,7 @@ def lambda_handler(event, context):
         }
         
     except Exception as e:
+        metrics.count('errors')
         print(str(e))
         return {
             'statusCode': 500,  # Indicate it's a server error
@@ -88,6 +128,189 @@ def lambda_handler(event, context):
             'body': json.dumps({"error": str(e)})
         }
 
+    finally:
+        metrics.emit()
+
+
+def generate_comment(post_id, metrics):
+    """Run the full download, caption, Rekognition and Llama pipeline for a post."""
+
+    # Initialize Reddit Client
+    with metrics.stage('redditClient'):
+        reddit = initialize_reddit_client()
+
+    # Use PRAW to get the submission object, attributes are fetched lazily on first access
+    with metrics.stage('submission'):
+        submission = reddit.submission(id=post_id)
+
+        # Initialize response dictionary
+        response = {
+            "id": submission.id,
+            "title": submission.title,
+            "body": submission.selftext,
+            "url": submission.url
+        }
+
+    prompt = initialize_prompt(response)
+
+    # If there is an image, download and normalize it once for every consumer
+    image_bytes = prepare_image(submission.url, metrics) if is_image_url(submission.url) else None
+
+    if image_bytes is not None:
+
+        # Upload the normalized image to S3 for Rekognition
+        with metrics.stage('s3Upload'):
+            object_key = upload_image_to_s3(bucket_name, f"image_{submission.id}.jpg", image_bytes)
+
+        # Generate an image caption using the BLIP model
+        with metrics.stage('caption'):
+            image_caption = generate_image_caption(blip_endpoint_name, submission.url, image_bytes)
+        with metrics.stage('rekognition'):
+            celebrities, detected_texts = get_celebrity_text(bucket_name, object_key)
+
+    else:
+        image_caption, celebrities, detected_texts = ('','','')
+
+    # format image context
+    image_context = format_image_context(image_caption, celebrities, detected_texts)
+
+    #finalize prompt
+    final_prompt = finalize_prompt(prompt, image_context)
+
+    # Get a response from the Llama2 model using the post title and image caption
+    with metrics.stage('llm'):
+        return get_llama_response(llm_endpoint_name, final_prompt)
+
+
+def get_cached_response(post_id, metrics):
+    """Return the cached comment for a post, checking the container cache before DynamoDB."""
+
+    now = int(time.time())
+
+    # Warm containers keep recent results in memory
+    cached = local_cache.get(post_id)
+    if cached and cached[1] > now:
+        local_cache.move_to_end(post_id)
+        return cached[0]
+    if cached:
+        del local_cache[post_id]
+
+    # The cache is best-effort, a DynamoDB failure is treated as a miss
+    try:
+        item = get_table(results_table_name).get_item(Key={'resultId': f"post#{post_id}"}).get('Item')
+    except Exception as e:
+        print(f"Cache lookup failed for {post_id}: {e}")
+        metrics.count('cacheErrors')
+        return None
+    # DynamoDB TTL deletes lazily, so expired items can still be returned
+    if item and int(item['expiresAt']) > now:
+        remember_response(post_id, item['response'], int(item['expiresAt']))
+        return item['response']
+
+    return None
+
+
+def cache_response(post_id, llama_response, metrics):
+    """Cache the generated comment for a post in the container and in DynamoDB."""
+
+    expires_at = int(time.time()) + CACHE_TTL_SECONDS
+    remember_response(post_id, llama_response, expires_at)
+    # Best-effort, the generated comment is still returned if DynamoDB is unavailable
+    try:
+        get_table(results_table_name).put_item(
+            Item={'resultId': f"post#{post_id}", 'response': llama_response, 'expiresAt': expires_at}
+        )
+    except Exception as e:
+        print(f"Cache write failed for {post_id}: {e}")
+        metrics.count('cacheErrors')
+
+
+def remember_response(post_id, llama_response, expires_at):
+    """Keep a comment in the container cache, evicting the least recently used post beyond the size bound."""
+    local_cache[post_id] = (llama_response, expires_at)
+    local_cache.move_to_end(post_id)
+    while len(local_cache) > LOCAL_CACHE_MAX_ENTRIES:
+        local_cache.popitem(last=False)
+
+
+def start_job(post_id, context):
+    """Record a pending job and invoke this function asynchronously to run it."""
+
+    job_id = str(uuid.uuid4())
+    get_table(results_table_name).put_item(
+        Item={
+            'resultId': f"job#{job_id}",
+            'postId': post_id,
+            'status': JOB_PENDING,
+            'expiresAt': int(time.time()) + JOB_TTL_SECONDS
+        }
+    )
+
+    get_client('lambda').invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType='Event',
+        Payload=json.dumps({'source': ASYNC_JOB_SOURCE, 'job_id': job_id, 'post_id': post_id})
+    )
+
+    return job_id
+
+
+def run_job(job_id, post_id, metrics):
+    """Generate the comment for a job and store the result (or error) on the job item."""
+
+    try:
+        with metrics.stage('cacheLookup'):
+            llama_response = get_cached_response(post_id, metrics)
+        metrics.record_cache('resultCache', hit=llama_response is not None)
+        if llama_response is None:
+            llama_response = generate_comment(post_id, metrics)
+            with metrics.stage('cacheWrite'):
+                cache_response(post_id, llama_response, metrics)
+        get_table(results_table_name).update_item(
+            Key={'resultId': f"job#{job_id}"},
+            UpdateExpression="SET #status = :status, #response = :response",
+            ExpressionAttributeNames={'#status': 'status', '#response': 'response'},
+            ExpressionAttributeValues={':status': JOB_SUCCEEDED, ':response': llama_response}
+        )
+    except Exception as e:
+        metrics.count('errors')
+        print(str(e))
+        get_table(results_table_name).update_item(
+            Key={'resultId': f"job#{job_id}"},
+            UpdateExpression="SET #status = :status, #error = :error",
+            ExpressionAttributeNames={'#status': 'status', '#error': 'error'},
+            ExpressionAttributeValues={':status': JOB_FAILED, ':error': str(e)}
+        )
+
+
+def poll_job(job_id, wait_seconds=0):
+    """Return the status of a job, long-polling up to `wait_seconds` for it to finish."""
+
+    deadline = time.time() + min(wait_seconds, MAX_LONG_POLL_SECONDS)
+    while True:
+        item = get_table(results_table_name).get_item(Key={'resultId': f"job#{job_id}"}, ConsistentRead=True).get('Item')
+        if item is None:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': f"Unknown job_id {job_id}"})
+            }
+        if item['status'] != JOB_PENDING or time.time() >= deadline:
+            break
+        time.sleep(LONG_POLL_INTERVAL_SECONDS)
+
+    result = {'job_id': job_id, 'status': item['status']}
+    if 'response' in item:
+        result['response'] = item['response']
+    if 'error' in item:
+        result['error'] = item['error']
+
+    return {
+        'statusCode': 202 if item['status'] == JOB_PENDING else 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps(result)
+    }
+
 
 def get_secret():
     """Get secret from AWS Secrets Manager"""
@@ -95,6 +318,9 @@ def get_secret():
     secret_name = "reddit_scraper"
     region_name = "us-east-1"
 
+    import boto3
+    from botocore.exceptions import ClientError
+
     # Create a Secrets Manager client
     session = boto3.session.Session()
     client = session.client(
@@ -115,6 +341,8 @@ def get_secret():
 
 
 def initialize_reddit_client():
+    import praw
+
     secret = get_secret()
     reddit = praw.Reddit(
         client_id=secret['client_id'],
@@ -126,63 +354,29 @@ def initialize_reddit_client():
     return reddit
 
 
-def initialize_prompt(response):
-        
-    reddit_post = response['title'] + '\n\n' + response['body'] if response['body'] else response['title']
-
-    user_prompt = f"""### Instruction:
-Respond to this Reddit post with an award winning top comment.
-
-### Reddit Post:
-{reddit_post}
-
-### Image Context:\n"""
-    
-    return user_prompt
-
-
-def format_image_context(image_caption, celebrities, detected_texts):
-    
-    image_context = f"""- Description:{image_caption}\n-Text:{detected_texts}\n-Celebrities:{celebrities}\n\n"""
-    
-    return image_context
-    
-
-def finalize_prompt(base_prompt, image_context):
-    
-    final_prompt = base_prompt + image_context + """### Response:\n"""
-    
-    return final_prompt
-
-
-def download_image(image_id, image_url):
-    
-    local_filename = f"/tmp/image_{image_id}{image_url.split('.')[1]}"
-    urlretrieve(image_url, local_filename)
-    
-    return local_filename
-
-
-def upload_image_to_s3(bucket_name, image_path):
-    s3 = boto3.client('s3')
-    object_key = f"reddit/funny/inference/posts/{os.path.basename(image_path)}"
-    s3.upload_file(image_path, bucket_name, object_key)
+def upload_image_to_s3(bucket_name, image_name, image_bytes):
+    s3 = get_client('s3')
+    object_key = f"reddit/funny/inference/posts/{image_name}"
+    s3.put_object(Bucket=bucket_name, Key=object_key, Body=image_bytes, ContentType='image/jpeg')
     return object_key
 
 
-def generate_image_caption(endpoint_name, img_url):
+def generate_image_caption(endpoint_name, img_url, image_bytes=None):
     
 
     # Create a SageMaker runtime client
-    client = boto3.client('sagemaker-runtime')
+    client = get_client('sagemaker-runtime')
 
     # Provide the payload you want to use for prediction
+    # Send the normalized image inline when we have it, so BLIP sees the same bytes as Rekognition
     data = {
         "inputs": {
             "img_url": img_url,
             "text" : "An image of ",
         }
     }
+    if image_bytes is not None:
+        data["inputs"]["image"] = base64.b64encode(image_bytes).decode()
     payload = json.dumps(data)
 
     # Specify the content type and accept headers
@@ -203,7 +397,7 @@ def generate_image_caption(endpoint_name, img_url):
 def get_celebrity_text(bucket_name, object_key):
 
     # Initialize the Rekognition client
-    rekognition = boto3.client('rekognition')
+    rekognition = get_client('rekognition')
 
     # Call Rekognition for Celebrity Recognition
     celebrity_response = rekognition.recognize_celebrities(
@@ -226,7 +420,7 @@ def get_llama_response(endpoint_name, text_input):
     """Generate a response using the Llama model hosted on a SageMaker endpoint."""
     
     # Initialize the SageMaker runtime client
-    client = boto3.client('sagemaker-runtime')
+    client = get_client('sagemaker-runtime')
 
     # Prepare the payload for the SageMaker endpoint
     payload = {
@@ -1,92 +1,132 @@
-import os
-import io
 import json
-import boto3
-import praw
-from botocore.exceptions import ClientError
-from urllib.request import urlretrieve
+import base64
+
+from services.stage_metrics import StageMetrics
+from services.aws import get_client, get_table
+from services.image_normalization import prepare_image, is_image_url
+from services.prompts import initialize_prompt, format_image_context, finalize_prompt
+
+processed_table_name = 'processed-reddit-submissions'
+
+bucket_name = 'sagemaker-us-east-1-513033806411'
+
+blip_endpoint_name = "huggingface-pytorch-inference-2024-03-08-16-01-37-935"
+llm_endpoint_name = "huggingface-pytorch-tgi-inference-2024-03-08-17-46-49-268"
 
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table('processed-reddit-submissions')
 
 def lambda_handler(event, context):
-    
-    try:
 
-        bucket_name = 'sagemaker-us-east-1-513033806411'
+    metrics = StageMetrics('phase-ii')
 
-        blip_endpoint_name = "huggingface-pytorch-inference-2024-03-08-16-01-37-935"
-        llm_endpoint_name = "huggingface-pytorch-tgi-inference-2024-03-08-17-46-49-268"
+    try:
 
         # Initialize Reddit Client
-        reddit = initialize_reddit_client()
+        with metrics.stage('redditClient'):
+            reddit = initialize_reddit_client()
 
         # get submissions for the last hour
-        for submission in reddit.subreddit("funny").top(time_filter="hour"):
+        with metrics.stage('listing'):
+            submissions = list(reddit.subreddit("funny").top(time_filter="hour"))
+        metrics.count('submissionsListed', len(submissions))
+
+        for submission in submissions:
 
             # check processed-reddit-submissions table
-            processed = check_and_process_submission(submission.id)
+            with metrics.stage('dedupe'):
+                processed = check_and_process_submission(submission.id)
+            metrics.record_cache('processedSubmission', hit=not processed)
             if not processed:
                 print(f"Skipping already processed submission: {submission.id}")
                 continue  # Skip to the next submission if this one has been processed
 
-            # Initialize response dictionary
-            response = {
-                "id": submission.id,
-                "title": submission.title,
-                "body": submission.selftext,
-                "url": submission.url
-            }
+            # One bad post must not end the run. Nothing has been posted yet, so it is released for the next run
+            try:
+                generated_comment = generate_comment(submission, metrics)
+            except Exception as e:
+                metrics.count('errors')
+                print(f"Failed to process submission {submission.id}: {e}")
+                release_submission(submission.id)
+                continue
 
-            prompt = initialize_prompt(response)
+            if generated_comment is None:
+                continue
 
-            # If there is an image, process it
-            if submission.url.endswith(('.jpg', '.png', '.jpeg')):
+            # submit comment. A failed reply keeps the marker: Reddit may have stored the comment
+            # anyway, and a duplicate comment is worse than a missed post
+            print(generated_comment)
+            try:
+                with metrics.stage('reply'):
+                    submission.reply(generated_comment)
+                metrics.count('commentsPosted')
+            except Exception as e:
+                metrics.count('errors')
+                print(f"Failed to reply to submission {submission.id}: {e}")
 
-                # Download the image to a temporary location
-                image_path = download_image(submission.id, submission.url)
+    except Exception as e:
+        metrics.count('errors')
+        print(str(e))
 
-                # Upload the image to S3
-                object_key = upload_image_to_s3(bucket_name, image_path)
+    finally:
+        metrics.emit()
 
-                # Generate an image caption using the BLIP model
-                image_caption = generate_image_caption(blip_endpoint_name, submission.url)
-                celebrities, detected_texts = get_celebrity_text(bucket_name, object_key)
 
-            else:
-                # don't process
-                continue
+def generate_comment(submission, metrics):
+    """Caption and prompt a single submission and return the generated comment, or None if it has no image."""
 
-            # format image context
-            image_context = format_image_context(image_caption, celebrities, detected_texts)
+    # Initialize response dictionary
+    response = {
+        "id": submission.id,
+        "title": submission.title,
+        "body": submission.selftext,
+        "url": submission.url
+    }
 
-            #finalize prompt
-            final_prompt = finalize_prompt(prompt, image_context)
+    prompt = initialize_prompt(response)
 
-            llama_params = {
-                "max_new_tokens": 128,
-                "top_p": 0.9,
-                "temperature": 0.9,
-                "stop": ["</s>"]
-            }
+    # If there is an image, download and normalize it once for every consumer
+    image_bytes = prepare_image(submission.url, metrics) if is_image_url(submission.url) else None
 
-            # Get a response from the Llama2 model using the post title and image caption
-            llama_response = get_llama_response(llm_endpoint_name, final_prompt, llama_params)
+    if image_bytes is None:
+        # don't process
+        metrics.count('submissionsWithoutImage')
+        return None
 
-            # retry
-            if json.dumps(llama_response) == "[removed]":
-                llama_params['temperature'] = 0.6
-                llama_response = get_llama_response(llm_endpoint_name, final_prompt, llama_params)
+    # Upload the normalized image to S3 for Rekognition
+    with metrics.stage('s3Upload'):
+        object_key = upload_image_to_s3(bucket_name, f"image_{submission.id}.jpg", image_bytes)
 
-            # decode unicode response
-            generated_comment = decode_unicode_strings(json.dumps(llama_response))
+    # Generate an image caption using the BLIP model
+    with metrics.stage('caption'):
+        image_caption = generate_image_caption(blip_endpoint_name, submission.url, image_bytes)
+    with metrics.stage('rekognition'):
+        celebrities, detected_texts = get_celebrity_text(bucket_name, object_key)
 
-            # submit comment
-            print(generated_comment)
-            submission.reply(generated_comment)
+    # format image context
+    image_context = format_image_context(image_caption, celebrities, detected_texts)
 
-    except Exception as e:
-        print(str(e))
+    #finalize prompt
+    final_prompt = finalize_prompt(prompt, image_context)
+
+    llama_params = {
+        "max_new_tokens": 128,
+        "top_p": 0.9,
+        "temperature": 0.9,
+        "stop": ["</s>"]
+    }
+
+    # Get a response from the Llama2 model using the post title and image caption
+    with metrics.stage('llm'):
+        llama_response = get_llama_response(llm_endpoint_name, final_prompt, llama_params)
+
+    # retry
+    if json.dumps(llama_response) == "[removed]":
+        llama_params['temperature'] = 0.6
+        metrics.count('llmRetries')
+        with metrics.stage('llm'):
+            llama_response = get_llama_response(llm_endpoint_name, final_prompt, llama_params)
+
+    # decode unicode response
+    return decode_unicode_strings(json.dumps(llama_response))
 
 
 def decode_unicode_strings(input_string):
@@ -97,6 +137,7 @@ def decode_unicode_strings(input_string):
 
 def check_and_process_submission(submission_id):
     # Check if the submission has already been processed
+    table = get_table(processed_table_name)
     response = table.get_item(
         Key={'submissionId': submission_id}
     )
@@ -110,12 +151,23 @@ def check_and_process_submission(submission_id):
     return True
 
 
+def release_submission(submission_id):
+    """Remove the processed marker of a submission that failed, so the next run picks it up again."""
+    try:
+        get_table(processed_table_name).delete_item(Key={'submissionId': submission_id})
+    except Exception as e:
+        print(f"Failed to release submission {submission_id}: {e}")
+
+
 def get_secret():
     """Get secret from AWS Secrets Manager"""
 
     secret_name = "reddit_scraper"
     region_name = "us-east-1"
 
+    import boto3
+    from botocore.exceptions import ClientError
+
     # Create a Secrets Manager client
     session = boto3.session.Session()
     client = session.client(
@@ -136,6 +188,8 @@ def get_secret():
 
 
 def initialize_reddit_client():
+    import praw
+
     secret = get_secret()
     reddit = praw.Reddit(
         client_id=secret['client_id'],
@@ -147,63 +201,29 @@ def initialize_reddit_client():
     return reddit
 
 
-def initialize_prompt(response):
-
-    reddit_post = response['title'] + '\n\n' + response['body'] if response['body'] else response['title']
-
-    user_prompt = f"""### Instruction:
-Respond to this Reddit post with an award winning top comment.
-
-### Reddit Post:
-{reddit_post}
-
-### Image Context:\n"""
-
-    return user_prompt
-
-
-def format_image_context(image_caption, celebrities, detected_texts):
-
-    image_context = f"""- Description:{image_caption}\n-Text:{detected_texts}\n-Celebrities:{celebrities}\n\n"""
-
-    return image_context
-
-
-def finalize_prompt(base_prompt, image_context):
-
-    final_prompt = base_prompt + image_context + """### Response:\n"""
-
-    return final_prompt
-
-
-def download_image(image_id, image_url):
-
-    local_filename = f"/tmp/image_{image_id}{image_url.split('.')[1]}"
-    urlretrieve(image_url, local_filename)
-
-    return local_filename
-
-
-def upload_image_to_s3(bucket_name, image_path):
-    s3 = boto3.client('s3')
-    object_key = f"reddit/funny/inference/posts/{os.path.basename(image_path)}"
-    s3.upload_file(image_path, bucket_name, object_key)
+def upload_image_to_s3(bucket_name, image_name, image_bytes):
+    s3 = get_client('s3')
+    object_key = f"reddit/funny/inference/posts/{image_name}"
+    s3.put_object(Bucket=bucket_name, Key=object_key, Body=image_bytes, ContentType='image/jpeg')
     return object_key
 
 
-def generate_image_caption(endpoint_name, img_url):
+def generate_image_caption(endpoint_name, img_url, image_bytes=None):
 
 
     # Create a SageMaker runtime client
-    client = boto3.client('sagemaker-runtime')
+    client = get_client('sagemaker-runtime')
 
     # Provide the payload you want to use for prediction
+    # Send the normalized image inline when we have it, so BLIP sees the same bytes as Rekognition
     data = {
         "inputs": {
             "img_url": img_url,
             "text" : "An image of ",
         }
     }
+    if image_bytes is not None:
+        data["inputs"]["image"] = base64.b64encode(image_bytes).decode()
     payload = json.dumps(data)
 
     # Specify the content type and accept headers
@@ -224,7 +244,7 @@ def generate_image_caption(endpoint_name, img_url):
 def get_celebrity_text(bucket_name, object_key):
 
     # Initialize the Rekognition client
-    rekognition = boto3.client('rekognition')
+    rekognition = get_client('rekognition')
 
     # Call Rekognition for Celebrity Recognition
     celebrity_response = rekognition.recognize_celebrities(
@@ -247,7 +267,7 @@ def get_llama_response(endpoint_name, text_input, parameters):
     """Generate a response using the Llama model hosted on a SageMaker endpoint."""
 
     # Initialize the SageMaker runtime client
-    client = boto3.client('sagemaker-runtime')
+    client = get_client('sagemaker-runtime')
 
     # Prepare the payload for the SageMaker endpoint
     payload = {
@@ -12,9 +12,10 @@ from transformers import (
 from datasets import load_from_disk
 import torch
 
-import bitsandbytes as bnb
 from huggingface_hub import login, HfFolder
 
+from training_metrics import ThroughputMetricsCallback, parse_step_range
+
 
 def parse_arge():
     """Parse the arguments."""
@@ -56,15 +57,35 @@ def parse_arge():
     parser.add_argument(
         "--bf16",
         type=bool,
-        default=True if torch.cuda.get_device_capability()[0] == 8 else False,
+        default=True if torch.cuda.is_available() and torch.cuda.get_device_capability()[0] == 8 else False,
         help="Whether to use bf16.",
     )
+    parser.add_argument(
+        "--qlora",
+        action=argparse.BooleanOptionalAction,
+        default=torch.cuda.is_available(),
+        help="Whether to fine-tune 4-bit quantized LoRA adapters (needs CUDA and bitsandbytes), on by default on GPU. "
+        "With --no-qlora the model is fully fine-tuned, e.g. a tiny model on CPU.",
+    )
     parser.add_argument(
         "--merge_weights",
         type=bool,
         default=True,
         help="Whether to merge LoRA weights with base model.",
     )
+    # add throughput/memory instrumentation arguments
+    parser.add_argument(
+        "--metrics_file",
+        type=str,
+        default=None,
+        help="Path of the JSON lines training metrics file. Defaults to train_metrics.jsonl in SM_OUTPUT_DATA_DIR or the output dir.",
+    )
+    parser.add_argument(
+        "--profile_steps",
+        type=str,
+        default=None,
+        help="Optimizer step range 'start:end' (inclusive) to record with torch.profiler, e.g. '20:25'.",
+    )
     args, _ = parser.parse_known_args()
 
     if args.hf_token:
@@ -99,6 +120,8 @@ def print_trainable_parameters(model, use_4bit=False):
 
 # COPIED FROM https://github.com/artidoro/qlora/blob/main/qlora.py
 def find_all_linear_names(model):
+    import bitsandbytes as bnb
+
     lora_module_names = set()
     for name, module in model.named_modules():
         if isinstance(module, bnb.nn.Linear4bit):
@@ -162,30 +185,45 @@ def training_function(args):
     set_seed(args.seed)
 
     dataset = load_from_disk(args.dataset_path)
-    # load model from the hub with a bnb config
-    bnb_config = BitsAndBytesConfig(
-        load_in_4bit=True,
-        bnb_4bit_use_double_quant=True,
-        bnb_4bit_quant_type="nf4",
-        bnb_4bit_compute_dtype=torch.bfloat16,
-    )
+    if args.qlora:
+        # load model from the hub with a bnb config
+        bnb_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_use_double_quant=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.bfloat16,
+        )
 
-    model = AutoModelForCausalLM.from_pretrained(
-        args.model_id,
-        use_cache=False
-        if args.gradient_checkpointing
-        else True,  # this is needed for gradient checkpointing
-        device_map="auto",
-        quantization_config=bnb_config,
-    )
+        model = AutoModelForCausalLM.from_pretrained(
+            args.model_id,
+            use_cache=False
+            if args.gradient_checkpointing
+            else True,  # this is needed for gradient checkpointing
+            device_map="auto",
+            quantization_config=bnb_config,
+        )
 
-    # create peft config
-    model = create_peft_model(
-        model, gradient_checkpointing=args.gradient_checkpointing, bf16=args.bf16
-    )
+        # create peft config
+        model = create_peft_model(
+            model, gradient_checkpointing=args.gradient_checkpointing, bf16=args.bf16
+        )
+    else:
+        # full precision and full fine-tuning, for CPU runs of small models
+        model = AutoModelForCausalLM.from_pretrained(
+            args.model_id,
+            use_cache=False if args.gradient_checkpointing else True,
+        )
 
     # Define training args
     output_dir = "/tmp/llama2"
+    metrics_dir = os.environ.get("SM_OUTPUT_DATA_DIR", output_dir)
+    metrics_file = args.metrics_file or os.path.join(metrics_dir, "train_metrics.jsonl")
+    # profiler output goes to a profiler/ folder next to the metrics file
+    metrics_callback = ThroughputMetricsCallback(
+        metrics_file,
+        profile_steps=parse_step_range(args.profile_steps),
+    )
+
     training_args = TrainingArguments(
         output_dir=output_dir,
         per_device_train_batch_size=args.per_device_train_batch_size,
@@ -205,14 +243,15 @@ def training_function(args):
         model=model,
         args=training_args,
         train_dataset=dataset,
-        data_collator=default_data_collator,
+        data_collator=metrics_callback.wrap_collator(default_data_collator),
+        callbacks=[metrics_callback],
     )
 
     # Start training
     trainer.train()
 
-    sagemaker_save_dir="/opt/ml/model/"
-    if args.merge_weights:
+    sagemaker_save_dir = os.environ.get("SM_MODEL_DIR", "/opt/ml/model/")
+    if args.qlora and args.merge_weights:
         # merge adapter weights with base model and save
         # save int 4 model
         trainer.model.save_pretrained(output_dir, safe_serialization=False)
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import resource
+from collections import deque
+
+import torch
+from transformers import TrainerCallback
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile of a list of numbers (q in [0, 100])."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def parse_step_range(step_range):
+    """Parse a "start:end" step range (inclusive) into a tuple of ints."""
+    if not step_range:
+        return None
+    start, end = step_range.split(":")
+    start, end = int(start), int(end)
+    if start < 1 or end < start:
+        raise ValueError(f"Invalid step range '{step_range}'. Expected 'start:end' with 1 <= start <= end.")
+    return start, end
+
+
+def peak_memory_bytes():
+    """Peak allocated memory: CUDA allocator peak on GPU, process max RSS on CPU."""
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated(), "cuda"
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, "cpu"
+
+
+class ThroughputMetricsCallback(TrainerCallback):
+    """
+    Records tokens/sec, step time, dataloader wait and peak memory for every
+    optimizer step and writes them as JSON lines to `metrics_file`.
+
+    Tokens are counted from the collated batches, so the data collator must be
+    wrapped with `wrap_collator`. Counts are queued per batch and consumed
+    `gradient_accumulation_steps` at a time, so dataloader prefetching does not
+    shift tokens onto the wrong step. All numbers are per process.
+
+    Dataloader wait is the time between the end of one optimizer step and the
+    start of the next, which is where the Trainer fetches the next batch.
+
+    If `profile_steps` is given as (start, end), a torch.profiler window is
+    recorded over those optimizer steps and exported to `profiler_dir`.
+    """
+
+    def __init__(self, metrics_file, profile_steps=None, profiler_dir=None):
+        self.metrics_file = metrics_file
+        self.profile_steps = profile_steps
+        self.profiler_dir = profiler_dir or os.path.join(os.path.dirname(metrics_file), "profiler")
+        self.profiler = None
+        self.batch_tokens = deque()
+        self.step_times = []
+        self.dataloader_waits = []
+        self.step_tokens = []
+        self.train_start = None
+        self.step_start = None
+        self.last_step_end = None
+        self.writer = None
+
+    def wrap_collator(self, collator):
+        """Wrap a data collator so every collated batch is counted towards the current step."""
+        def counting_collator(features):
+            batch = collator(features)
+            if "attention_mask" in batch:
+                self.batch_tokens.append(int(batch["attention_mask"].sum()))
+            else:
+                self.batch_tokens.append(batch["input_ids"].numel())
+            return batch
+        return counting_collator
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        if state.is_world_process_zero:
+            os.makedirs(os.path.dirname(os.path.abspath(self.metrics_file)), exist_ok=True)
+            self.writer = open(self.metrics_file, "w")
+        self.train_start = time.perf_counter()
+        self.last_step_end = self.train_start
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self.step_start = time.perf_counter()
+        self.dataloader_waits.append(self.step_start - self.last_step_end)
+
+        # state.global_step is the number of completed steps, so this is step global_step + 1
+        if self.profile_steps and state.global_step + 1 == self.profile_steps[0]:
+            self._start_profiler()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if torch.cuda.is_available():
+            # kernels are launched asynchronously, wait for them so the step time is real
+            torch.cuda.synchronize()
+        step_time = time.perf_counter() - self.step_start
+
+        # the oldest collated batches belong to this step (one per gradient accumulation step)
+        tokens = 0
+        for _ in range(min(args.gradient_accumulation_steps, len(self.batch_tokens))):
+            tokens += self.batch_tokens.popleft()
+        self.step_times.append(step_time)
+        self.step_tokens.append(tokens)
+
+        if self.profiler is not None:
+            self.profiler.step()
+            if state.global_step >= self.profile_steps[1]:
+                self._stop_profiler()
+
+        if self.writer is not None:
+            peak_bytes, device = peak_memory_bytes()
+            record = {
+                "type": "step",
+                "step": state.global_step,
+                "epoch": state.epoch,
+                "step_time_s": step_time,
+                "dataloader_wait_s": self.dataloader_waits[-1],
+                "tokens": tokens,
+                "tokens_per_second": tokens / step_time if step_time > 0 else None,
+                "peak_memory_bytes": peak_bytes,
+                "device": device,
+            }
+            self.writer.write(json.dumps(record) + "\n")
+
+        # set last, so exporting the profiler trace and writing the record are not counted as dataloader wait
+        self.last_step_end = time.perf_counter()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if self.profiler is not None:
+            self._stop_profiler()
+
+        if self.writer is None:
+            return
+
+        wall_time = time.perf_counter() - self.train_start
+        total_tokens = sum(self.step_tokens)
+        busy_time = sum(self.step_times)
+        peak_bytes, device = peak_memory_bytes()
+        summary = {
+            "type": "summary",
+            "steps": len(self.step_times),
+            "wall_time_s": wall_time,
+            "total_tokens": total_tokens,
+            "tokens_per_second": total_tokens / wall_time if wall_time > 0 else None,
+            "tokens_per_second_excl_dataloader": total_tokens / busy_time if busy_time > 0 else None,
+            "step_time_p50_s": percentile(self.step_times, 50),
+            "step_time_p90_s": percentile(self.step_times, 90),
+            "step_time_p99_s": percentile(self.step_times, 99),
+            "step_time_max_s": max(self.step_times) if self.step_times else None,
+            "dataloader_wait_total_s": sum(self.dataloader_waits),
+            "dataloader_wait_p50_s": percentile(self.dataloader_waits, 50),
+            "dataloader_wait_p99_s": percentile(self.dataloader_waits, 99),
+            "dataloader_wait_fraction": sum(self.dataloader_waits) / wall_time if wall_time > 0 else None,
+            "peak_memory_bytes": peak_bytes,
+            "device": device,
+        }
+        self.writer.write(json.dumps(summary) + "\n")
+        self.writer.close()
+        self.writer = None
+
+        print(
+            f"tokens/s: {summary['tokens_per_second']} || step time p50/p99: "
+            f"{summary['step_time_p50_s']}/{summary['step_time_p99_s']} s || "
+            f"dataloader wait: {summary['dataloader_wait_fraction']} of wall time || "
+            f"peak memory ({device}): {peak_bytes / 2**20:.1f} MiB"
+        )
+
+    def _start_profiler(self):
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.profiler = torch.profiler.profile(
+            activities=activities,
+            record_shapes=True,
+            profile_memory=True,
+        )
+        self.profiler.start()
+
+    def _stop_profiler(self):
+        self.profiler.stop()
+        os.makedirs(self.profiler_dir, exist_ok=True)
+        start, end = self.profile_steps
+        trace_path = os.path.join(self.profiler_dir, f"trace_steps_{start}-{end}.json")
+        self.profiler.export_chrome_trace(trace_path)
+        sort_by = "cuda_time_total" if torch.cuda.is_available() else "cpu_time_total"
+        with open(os.path.join(self.profiler_dir, f"summary_steps_{start}-{end}.txt"), "w") as f:
+            f.write(self.profiler.key_averages().table(sort_by=sort_by, row_limit=50))
+        print(f"Profiler trace for steps {start}-{end} written to {trace_path}")
+        self.profiler = None
@@ -0,0 +1,152 @@
+import os
+import sys
+import glob
+import shutil
+import zipfile
+import argparse
+import tempfile
+import compileall
+import subprocess
+import py_compile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REQUIREMENTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "requirements.txt")
+
+# handler -> (lambda_function.py, services modules it imports, whether it needs the bundled requirements)
+HANDLERS = {
+    "phase_i": ("deployment_phase_i/lambda_function.py", ["aws", "stage_metrics", "image_normalization", "prompts"], True),
+    "phase_ii": ("deployment_phase_ii/lambda_function.py", ["aws", "stage_metrics", "image_normalization", "prompts"], True),
+    "enrichment": ("data_enrichment_and_preparation/lambda_function.py", ["aws", "stage_metrics"], False),
+}
+
+# Files the handlers never load. Pillow's AVIF, FreeType, LCMS and Tk extensions are optional
+# plugins (Pillow reports them as unsupported when missing) and their libraries make up most of the wheel.
+PRUNE_PATTERNS = [
+    "bin",
+    "**/__pycache__",
+    "**/tests",
+    "PIL/_avif.*",
+    "PIL/_imagingft.*",
+    "PIL/_imagingcms.*",
+    "PIL/_imagingtk.*",
+    "pillow.libs/libavif-*",
+    "pillow.libs/libfreetype-*",
+    "pillow.libs/libharfbuzz-*",
+    "pillow.libs/libpng16-*",
+    "pillow.libs/libbrotli*",
+    "pillow.libs/liblcms2-*",
+]
+
+# Fixed timestamp so the same inputs always produce a byte-identical zip
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def parse_args():
+    """Parse the arguments."""
+    parser = argparse.ArgumentParser(description="Build a slim, reproducible Lambda deployment package for a handler.")
+    parser.add_argument("--handlers", type=str, default=",".join(HANDLERS), help="Comma separated handlers to build.")
+    parser.add_argument("--output_dir", type=str, default=os.path.join(REPO_ROOT, "lambda_packaging", "dist"), help="Folder for the <handler>.zip packages.")
+    parser.add_argument("--platform", type=str, default="manylinux2014_x86_64", help="Wheel platform of the Lambda architecture (manylinux2014_aarch64 for arm64).")
+    parser.add_argument("--no_prune", action="store_true", help="Keep tests, scripts and unused Pillow plugins.")
+    parser.add_argument("--no_compile", action="store_true", help="Ship sources only instead of precompiled bytecode.")
+    return parser.parse_args()
+
+
+def install_requirements(build_dir, platform):
+    """Install the pinned requirements as wheels for the Lambda platform and this interpreter's Python version."""
+    python_version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    subprocess.run(
+        [
+            sys.executable, "-m", "pip", "install",
+            "--quiet",
+            "--target", build_dir,
+            "--platform", platform,
+            "--implementation", "cp",
+            "--python-version", python_version,
+            "--only-binary=:all:",
+            "--no-compile",
+            "--no-deps",
+            "-r", REQUIREMENTS,
+        ],
+        check=True,
+    )
+
+
+def prune(build_dir):
+    """Remove files matching PRUNE_PATTERNS and return the number of bytes removed."""
+    removed = 0
+    for pattern in PRUNE_PATTERNS:
+        for path in glob.glob(os.path.join(build_dir, pattern), recursive=True):
+            if os.path.isdir(path):
+                removed += sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                removed += os.path.getsize(path)
+                os.remove(path)
+    return removed
+
+
+def copy_handler(build_dir, handler):
+    source, services_modules, _ = HANDLERS[handler]
+    shutil.copy(os.path.join(REPO_ROOT, source), os.path.join(build_dir, "lambda_function.py"))
+    os.makedirs(os.path.join(build_dir, "services"))
+    for module in services_modules:
+        shutil.copy(os.path.join(REPO_ROOT, "services", f"{module}.py"), os.path.join(build_dir, "services", f"{module}.py"))
+
+
+def compile_bytecode(build_dir):
+    # /var/task is read-only, so without bundled bytecode every cold start recompiles every module it imports.
+    # Unchecked hash-based pycs skip the source timestamp check at import, and compiling them against
+    # the /var/task path keeps the build folder out of the bytecode so rebuilds are byte-identical.
+    compileall.compile_dir(
+        build_dir, ddir="/var/task", quiet=1, invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH
+    )
+
+
+def write_zip(build_dir, zip_path):
+    """Zip the build folder with sorted entries, fixed timestamps and fixed permissions."""
+    paths = []
+    for root, dirs, names in os.walk(build_dir):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(names))
+
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        for path in paths:
+            info = zipfile.ZipInfo(os.path.relpath(path, build_dir), date_time=ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = (0o755 if os.access(path, os.X_OK) else 0o644) << 16
+            with open(path, "rb") as f:
+                zf.writestr(info, f.read(), compresslevel=9)
+    return len(paths)
+
+
+def build(handler, args):
+    _, _, needs_requirements = HANDLERS[handler]
+    with tempfile.TemporaryDirectory() as build_dir:
+        removed = 0
+        if needs_requirements:
+            install_requirements(build_dir, args.platform)
+            if not args.no_prune:
+                removed = prune(build_dir)
+        copy_handler(build_dir, handler)
+        if not args.no_compile:
+            compile_bytecode(build_dir)
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        zip_path = os.path.join(args.output_dir, f"{handler}.zip")
+        num_files = write_zip(build_dir, zip_path)
+        unzipped = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(build_dir) for name in names)
+
+    print(f"{handler}: {zip_path} || {num_files} files || {os.path.getsize(zip_path) / 1e6:.1f} MB zipped, "
+          f"{unzipped / 1e6:.1f} MB unzipped || pruned {removed / 1e6:.1f} MB")
+
+
+def main():
+    args = parse_args()
+    print(f"Building for the python{sys.version_info.major}.{sys.version_info.minor} runtime on {args.platform}")
+    for handler in args.handlers.split(","):
+        build(handler, args)
+
+
+if __name__ == "__main__":
+    main()
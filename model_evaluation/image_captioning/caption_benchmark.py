@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import queue
+import argparse
+import resource
+import multiprocessing
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TEST_IMAGES_DIR = os.path.join(REPO_ROOT, "images", "test_images")
+
+DEFAULT_MODELS = [
+    "Salesforce/blip-image-captioning-base",
+    "Salesforce/blip-image-captioning-large",
+    "nlpconnect/vit-gpt2-image-captioning",
+]
+
+
+def parse_args():
+    """Parse the arguments."""
+    parser = argparse.ArgumentParser(description="CPU latency, memory and caption benchmark of image captioning models.")
+    parser.add_argument("--models", type=str, default=",".join(DEFAULT_MODELS), help="Comma separated model IDs or local paths.")
+    parser.add_argument("--images_dir", type=str, default=TEST_IMAGES_DIR, help="Folder of images to caption.")
+    parser.add_argument("--batch_sizes", type=str, default="1,4,8", help="Comma separated batch sizes.")
+    parser.add_argument("--repeats", type=int, default=2, help="Passes over the image set per batch size.")
+    parser.add_argument("--max_new_tokens", type=int, default=20, help="Max new tokens per caption, 20 matches the BLIP endpoint.")
+    parser.add_argument("--prompt", type=str, default="An image of ", help="Conditional prompt for BLIP models, the exact string the Lambdas send.")
+    parser.add_argument("--num_threads", type=int, default=None, help="torch CPU threads, defaults to torch's choice.")
+    parser.add_argument("--instance_cost_per_hour", type=float, default=0.23, help="USD per hour of the CPU instance, used for cost per caption.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for torch.")
+    parser.add_argument("--output_dir", type=str, default="caption_benchmark_results", help="Folder for results.json and results.md.")
+    return parser.parse_args()
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_captioner(model_id, max_new_tokens, prompt):
+    """Load a model on CPU and return a function that captions a list of PIL images."""
+    import torch
+    from transformers import AutoConfig
+
+    model_type = AutoConfig.from_pretrained(model_id).model_type
+
+    if model_type == "blip":
+        from transformers import BlipProcessor, BlipForConditionalGeneration
+
+        processor = BlipProcessor.from_pretrained(model_id)
+        model = BlipForConditionalGeneration.from_pretrained(model_id).eval()
+
+        def caption(images):
+            if prompt:
+                inputs = processor(images, [prompt] * len(images), return_tensors="pt")
+            else:
+                inputs = processor(images, return_tensors="pt")
+            with torch.inference_mode():
+                out = model.generate(**inputs, max_new_tokens=max_new_tokens)
+            return processor.batch_decode(out, skip_special_tokens=True)
+
+    elif model_type == "vision-encoder-decoder":
+        from transformers import AutoImageProcessor, AutoTokenizer, VisionEncoderDecoderModel
+
+        image_processor = AutoImageProcessor.from_pretrained(model_id)
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model = VisionEncoderDecoderModel.from_pretrained(model_id).eval()
+
+        def caption(images):
+            pixel_values = image_processor(images, return_tensors="pt").pixel_values
+            with torch.inference_mode():
+                out = model.generate(pixel_values=pixel_values, max_new_tokens=max_new_tokens)
+            return [text.strip() for text in tokenizer.batch_decode(out, skip_special_tokens=True)]
+
+    else:
+        raise ValueError(f"Unsupported model type '{model_type}' for {model_id}. Expected 'blip' or 'vision-encoder-decoder'.")
+
+    return caption
+
+
+def benchmark_model(model_id, args, image_paths, results_queue):
+    """Benchmark one model. Runs in its own process so peak RSS belongs to this model only."""
+    import torch
+    from PIL import Image
+
+    torch.manual_seed(args.seed)
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+
+    images = [Image.open(path).convert("RGB") for path in image_paths]
+    baseline_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    caption = load_captioner(model_id, args.max_new_tokens, args.prompt)
+    load_time = time.perf_counter() - start
+    load_rss = peak_rss_mb()
+
+    # warm up so one-off allocations and lazy initialization are not timed
+    caption(images[:1])
+
+    runs = []
+    captions = None
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        batch_latencies = []
+        run_captions = []
+        run_start = time.perf_counter()
+        for _ in range(args.repeats):
+            for i in range(0, len(images), batch_size):
+                batch = images[i:i + batch_size]
+                batch_start = time.perf_counter()
+                run_captions.extend(caption(batch))
+                batch_latencies.append(((time.perf_counter() - batch_start) / len(batch), len(batch)))
+        run_time = time.perf_counter() - run_start
+        per_image = sorted(latency for latency, size in batch_latencies for _ in range(size))
+        num_captions = len(images) * args.repeats
+        throughput = num_captions / run_time
+        runs.append({
+            "batch_size": batch_size,
+            "per_image_latency_p50_s": per_image[len(per_image) // 2],
+            "per_image_latency_max_s": per_image[-1],
+            "throughput_images_per_s": throughput,
+            "cost_per_1k_captions_usd": args.instance_cost_per_hour / (throughput * 3600) * 1000,
+        })
+        if captions is None:
+            captions = dict(zip((os.path.basename(path) for path in image_paths), run_captions[:len(images)]))
+
+    results_queue.put({
+        "model": model_id,
+        "load_time_s": load_time,
+        "baseline_rss_mb": baseline_rss,
+        "rss_after_load_mb": load_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "runs": runs,
+        "captions": captions,
+    })
+
+
+def run_isolated(model_id, args, image_paths):
+    context = multiprocessing.get_context("spawn")
+    results_queue = context.Queue()
+    process = context.Process(target=benchmark_model, args=(model_id, args, image_paths, results_queue))
+    process.start()
+
+    # read the result before joining: the child only exits once its queued result is flushed through
+    # the pipe, so joining first deadlocks when the result is larger than the pipe buffer
+    result = None
+    while result is None:
+        try:
+            result = results_queue.get(timeout=5)
+        except queue.Empty:
+            if not process.is_alive():
+                # the result may have been flushed just before the process exited
+                try:
+                    result = results_queue.get(timeout=1)
+                except queue.Empty:
+                    pass
+                break
+    process.join()
+    if result is None:
+        return {"model": model_id, "error": f"benchmark process exited with code {process.exitcode}"}
+    return result
+
+
+def comparison_table(results):
+    """Markdown comparison table plus the captions of every model."""
+    lines = [
+        "| model | load s | peak RSS MB | batch | per-image p50 s | images/s | $ per 1k captions |",
+        "|---|---|---|---|---|---|---|",
+    ]
+    for result in results:
+        if "error" in result:
+            lines.append(f"| {result['model']} | {result['error']} | | | | | |")
+            continue
+        for run in result["runs"]:
+            lines.append(
+                f"| {result['model']} | {result['load_time_s']:.1f} | {result['peak_rss_mb']:.0f} | {run['batch_size']} "
+                f"| {run['per_image_latency_p50_s']:.3f} | {run['throughput_images_per_s']:.2f} | {run['cost_per_1k_captions_usd']:.4f} |"
+            )
+
+    captioned = [result for result in results if "captions" in result]
+    if captioned:
+        lines += ["", "| image | " + " | ".join(result["model"] for result in captioned) + " |",
+                  "|---|" + "---|" * len(captioned)]
+        for image in captioned[0]["captions"]:
+            lines.append(f"| {image} | " + " | ".join(result["captions"][image] for result in captioned) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    args = parse_args()
+    image_paths = sorted(
+        os.path.join(args.images_dir, name)
+        for name in os.listdir(args.images_dir)
+        if name.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".webp"))
+    )
+
+    results = []
+    for model_id in args.models.split(","):
+        print(f"Benchmarking {model_id} on {len(image_paths)} images...")
+        result = run_isolated(model_id, args, image_paths)
+        if "error" in result:
+            print(f"  {result['error']}")
+        else:
+            best = max(result["runs"], key=lambda run: run["throughput_images_per_s"])
+            print(f"  loaded in {result['load_time_s']:.1f} s, peak RSS {result['peak_rss_mb']:.0f} MB, "
+                  f"best {best['throughput_images_per_s']:.2f} images/s at batch size {best['batch_size']}")
+        results.append(result)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, "results.json"), "w") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    table = comparison_table(results)
+    with open(os.path.join(args.output_dir, "results.md"), "w") as f:
+        f.write(table)
+    print("\n" + table)
+
+
+if __name__ == "__main__":
+    main()
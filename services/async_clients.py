@@ -0,0 +1,257 @@
+import os
+import json
+import base64
+import random
+import asyncio
+import contextlib
+
+import aiohttp
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, HTTPClientError
+
+# Error codes worth retrying, everything else is raised to the caller right away
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "Throttling",
+    "TooManyRequestsException",
+    "ProvisionedThroughputExceededException",
+    "ServiceUnavailable",
+    "ServiceUnavailableException",
+    "InternalFailure",
+    "InternalServerError",
+    "InternalServerException",
+    "ModelNotReadyException",
+    "SlowDown",
+    "RequestTimeout",
+}
+
+DEFAULT_LLAMA_PARAMETERS = {
+    "max_new_tokens": 64,
+    "top_p": 0.9,
+    "temperature": 0.6,
+    "stop": ["</s>"]
+}
+
+
+class ServiceConfig:
+    """Connection, timeout and retry settings shared by every call of an AsyncServices instance."""
+
+    def __init__(
+        self,
+        region_name="us-east-1",
+        max_connections=100,
+        connect_timeout=5,
+        read_timeout=60,
+        call_timeout=30,
+        max_attempts=3,
+        base_delay=0.2,
+        max_delay=5.0,
+    ):
+        self.region_name = region_name
+        # upper bound of in-flight calls per service and of pooled connections per client
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # timeout of a single attempt, per call type overrides can be passed to the operations
+        self.call_timeout = call_timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+
+def is_retryable(error):
+    """Whether a failed attempt should be retried."""
+    if isinstance(error, (asyncio.TimeoutError, BotocoreConnectionError, HTTPClientError, aiohttp.ClientConnectionError)):
+        return True
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return code in RETRYABLE_ERROR_CODES or status >= 500
+    return False
+
+
+class AwsBackend:
+    """Real backend: aiobotocore clients and an aiohttp session, created once and shared by all calls."""
+
+    def __init__(self, config):
+        self.config = config
+        self.session = get_session()
+        self.exit_stack = contextlib.AsyncExitStack()
+        self.clients = {}
+        self.client_lock = asyncio.Lock()
+        self.http = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.config.max_connections)
+        timeout = aiohttp.ClientTimeout(sock_connect=self.config.connect_timeout, sock_read=self.config.read_timeout)
+        self.http = await self.exit_stack.enter_async_context(aiohttp.ClientSession(connector=connector, timeout=timeout))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.exit_stack.aclose()
+        self.clients = {}
+
+    async def client(self, service_name):
+        """Get the shared client of a service, creating it on first use."""
+        if service_name not in self.clients:
+            async with self.client_lock:
+                if service_name not in self.clients:
+                    botocore_config = AioConfig(
+                        max_pool_connections=self.config.max_connections,
+                        connect_timeout=self.config.connect_timeout,
+                        read_timeout=self.config.read_timeout,
+                        # retries are done by AsyncServices so they get jitter and a per call timeout
+                        retries={"total_max_attempts": 1},
+                    )
+                    self.clients[service_name] = await self.exit_stack.enter_async_context(
+                        self.session.create_client(service_name, region_name=self.config.region_name, config=botocore_config)
+                    )
+        return self.clients[service_name]
+
+    async def fetch(self, url):
+        """Download a URL and return its content."""
+        async with self.http.get(url, raise_for_status=True) as response:
+            return await response.read()
+
+
+class AsyncServices:
+    """
+    asyncio-native versions of the pipeline's service calls.
+
+    All calls share one backend (one aiobotocore client per service and one
+    aiohttp session), are bounded per service by `config.max_connections`, are
+    cancelled after `call_timeout` seconds per attempt and retried with full
+    jitter exponential backoff on throttling, timeouts and 5xx errors.
+
+    Usage:
+        async with AsyncServices(ServiceConfig(max_connections=200)) as services:
+            caption = await services.generate_image_caption(blip_endpoint_name, img_url)
+
+    Pass `backend=FakeBackend(...)` from services.fakes to run offline.
+    """
+
+    def __init__(self, config=None, backend=None):
+        self.config = config or ServiceConfig()
+        self.backend = backend or AwsBackend(self.config)
+        self.semaphores = {}
+
+    async def __aenter__(self):
+        await self.backend.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.backend.__aexit__(*exc_info)
+
+    async def call(self, service_name, operation, timeout=None, read_body=False, **kwargs):
+        """
+        Call `operation` of a service client with the concurrency limit, timeout and retries applied.
+
+        With `read_body` the streamed response["Body"] is read within the same attempt and replaced by
+        its bytes, so a slow or dropped body is covered by the timeout, the retries and the semaphore.
+        """
+        client = await self.backend.client(service_name)
+
+        async def attempt():
+            response = await getattr(client, operation)(**kwargs)
+            if read_body:
+                async with response["Body"] as stream:
+                    response["Body"] = await stream.read()
+            return response
+
+        return await self._with_retries(attempt, self._semaphore(service_name), timeout)
+
+    def _semaphore(self, name):
+        if name not in self.semaphores:
+            self.semaphores[name] = asyncio.Semaphore(self.config.max_connections)
+        return self.semaphores[name]
+
+    async def _with_retries(self, attempt_fn, semaphore, timeout=None):
+        timeout = timeout or self.config.call_timeout
+        for attempt in range(1, self.config.max_attempts + 1):
+            try:
+                async with semaphore:
+                    return await asyncio.wait_for(attempt_fn(), timeout)
+            except Exception as e:
+                if attempt == self.config.max_attempts or not is_retryable(e):
+                    raise
+                # full jitter: sleep a random time up to the exponential backoff cap
+                delay = min(self.config.max_delay, self.config.base_delay * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, delay))
+
+    async def download_image(self, image_url, timeout=None):
+        """Download an image and return its bytes."""
+        return await self._with_retries(lambda: self.backend.fetch(image_url), self._semaphore("http"), timeout)
+
+    async def upload_image_to_s3(self, bucket_name, image_path, image_bytes=None, timeout=None):
+        """Upload an image to the inference prefix of the bucket. Reads `image_path` unless `image_bytes` is given."""
+        if image_bytes is None:
+            with open(image_path, "rb") as f:
+                image_bytes = f.read()
+        object_key = f"reddit/funny/inference/posts/{os.path.basename(image_path)}"
+        await self.call("s3", "put_object", timeout=timeout, Bucket=bucket_name, Key=object_key, Body=image_bytes)
+        return object_key
+
+    async def generate_image_caption(self, endpoint_name, img_url, image_bytes=None, timeout=None):
+        """Generate an image caption using the BLIP model hosted on a SageMaker endpoint, inline `image_bytes` take precedence."""
+        data = {
+            "inputs": {
+                "img_url": img_url,
+                "text": "An image of ",
+            }
+        }
+        if image_bytes is not None:
+            data["inputs"]["image"] = base64.b64encode(image_bytes).decode()
+        response = await self.call(
+            "sagemaker-runtime",
+            "invoke_endpoint",
+            timeout=timeout,
+            read_body=True,
+            EndpointName=endpoint_name,
+            ContentType="application/json",
+            Accept="application/json",
+            Body=json.dumps(data),
+        )
+        return response["Body"].decode()
+
+    async def get_celebrity_text(self, bucket_name, object_key, timeout=None):
+        """Run celebrity recognition and text detection on an S3 image concurrently."""
+        image = {"S3Object": {"Bucket": bucket_name, "Name": object_key}}
+        celebrity_response, text_response = await asyncio.gather(
+            self.call("rekognition", "recognize_celebrities", timeout=timeout, Image=image),
+            self.call("rekognition", "detect_text", timeout=timeout, Image=image),
+        )
+        celebrities = ', '.join(celeb['Name'] for celeb in celebrity_response['CelebrityFaces'])
+        detected_texts = ' '.join(text_detection['DetectedText'] for text_detection in text_response['TextDetections'])
+        return celebrities, detected_texts
+
+    async def get_llama_response(self, endpoint_name, text_input, parameters=None, timeout=None, return_details=False):
+        """
+        Generate a response using the Llama model hosted on a SageMaker endpoint.
+
+        With `return_details` TGI is asked for generation details and (text, details) is returned,
+        where details holds e.g. `generated_tokens` and `finish_reason`.
+        """
+        parameters = parameters or DEFAULT_LLAMA_PARAMETERS
+        if return_details:
+            parameters = {**parameters, "details": True}
+        payload = {
+            "inputs": text_input,
+            "parameters": parameters,
+        }
+        response = await self.call(
+            "sagemaker-runtime",
+            "invoke_endpoint",
+            timeout=timeout,
+            read_body=True,
+            EndpointName=endpoint_name,
+            ContentType="application/json",
+            Body=json.dumps(payload),
+        )
+        result = json.loads(response["Body"].decode())
+        text = result[0].get("generated_text", "No response generated")
+        if return_details:
+            return text, result[0].get("details") or {}
+        return text
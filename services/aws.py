@@ -0,0 +1,20 @@
+# boto3 is imported on first use and AWS clients are created once per container,
+# so the Lambda init phase stays short and paths that don't need them never load boto3
+aws_clients = {}
+
+
+def get_client(service_name):
+    """Create an AWS client on first use and reuse it on warm invocations."""
+    if service_name not in aws_clients:
+        import boto3
+        aws_clients[service_name] = boto3.client(service_name)
+    return aws_clients[service_name]
+
+
+def get_table(table_name):
+    """Create a DynamoDB table resource on first use and reuse it on warm invocations."""
+    key = f"dynamodb:{table_name}"
+    if key not in aws_clients:
+        import boto3
+        aws_clients[key] = boto3.resource('dynamodb').Table(table_name)
+    return aws_clients[key]
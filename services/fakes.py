@@ -0,0 +1,158 @@
+import os
+import json
+import random
+import asyncio
+from collections import Counter
+
+from botocore.exceptions import ClientError
+
+TEST_IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "images", "test_images")
+
+
+class LatencyProfile:
+    """Simulated latency (seconds) and error rate of one fake operation."""
+
+    def __init__(self, mean=0.0, jitter=0.0, error_rate=0.0, error_code="ThrottlingException"):
+        self.mean = mean
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+
+    def sample(self, rng):
+        return max(0.0, self.mean + rng.uniform(-self.jitter, self.jitter))
+
+
+class FakeStreamingBody:
+    """Stand-in for aiobotocore's StreamingBody."""
+
+    def __init__(self, content):
+        self.content = content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def read(self):
+        return self.content
+
+
+class FakeClient:
+    """Async client that answers the operations the pipeline uses with boto-shaped responses."""
+
+    def __init__(self, service_name, backend):
+        self.service_name = service_name
+        self.backend = backend
+
+    async def invoke_endpoint(self, EndpointName, Body, **kwargs):
+        operation, content = self.backend.endpoint_response(json.loads(Body))
+        await self.backend.simulate(operation)
+        return {"Body": FakeStreamingBody(content.encode()), "ContentType": "application/json"}
+
+    async def recognize_celebrities(self, Image, **kwargs):
+        await self.backend.simulate("rekognition.recognize_celebrities")
+        return self.backend.celebrities_response()
+
+    async def detect_text(self, Image, **kwargs):
+        await self.backend.simulate("rekognition.detect_text")
+        return self.backend.text_response()
+
+    async def put_object(self, Bucket, Key, Body, **kwargs):
+        await self.backend.simulate("s3.put_object")
+        self.backend.objects[(Bucket, Key)] = Body
+        return {"ETag": f'"{hash(Body) & 0xffffffff:08x}"'}
+
+
+class FakeBackend:
+    """
+    Offline backend for AsyncServices. Every operation sleeps for its latency
+    profile and fails with a retryable error at its error rate, and every call
+    is counted in `calls`. Image downloads are served from `images_dir`: a
+    `file://` URL is read directly and any other URL maps to one of the images
+    in the folder.
+
+    The canned responses and `draw` are shared with the synchronous stand-ins
+    in benchmarks/local_services.py.
+
+    Operation names are "<service>.<operation>" plus "sagemaker-runtime.caption",
+    "sagemaker-runtime.llm" and "http.fetch", e.g.
+        FakeBackend(profiles={"sagemaker-runtime.llm": LatencyProfile(mean=2.0, jitter=0.5)})
+    """
+
+    def __init__(
+        self,
+        profiles=None,
+        default_profile=None,
+        images_dir=TEST_IMAGES_DIR,
+        caption="an image of a dog sitting on a couch",
+        comment="This is the funniest thing I've seen all day",
+        celebrities=(),
+        detected_texts=(),
+        seed=0,
+    ):
+        self.profiles = profiles or {}
+        self.default_profile = default_profile or LatencyProfile()
+        self.images_dir = images_dir
+        self.images = sorted(os.listdir(images_dir)) if images_dir and os.path.isdir(images_dir) else []
+        self.caption = caption
+        self.comment = comment
+        self.celebrities = list(celebrities)
+        self.detected_texts = list(detected_texts)
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.errors = Counter()
+        self.objects = {}
+        self.clients = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def client(self, service_name):
+        if service_name not in self.clients:
+            self.clients[service_name] = FakeClient(service_name, self)
+        return self.clients[service_name]
+
+    def draw(self, operation):
+        """Count the call and sample its latency and error, returning (latency, error or None)."""
+        profile = self.profiles.get(operation, self.default_profile)
+        self.calls[operation] += 1
+        latency = profile.sample(self.rng)
+        if self.rng.random() < profile.error_rate:
+            self.errors[operation] += 1
+            return latency, ClientError({"Error": {"Code": profile.error_code, "Message": "Simulated error"}}, operation)
+        return latency, None
+
+    async def simulate(self, operation):
+        """Count the call, wait for its latency and raise its error at the configured rate."""
+        latency, error = self.draw(operation)
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+
+    def endpoint_response(self, payload):
+        """Operation name and JSON body answering an invoke_endpoint payload: BLIP for image inputs, else the LLM."""
+        if isinstance(payload["inputs"], dict) and "img_url" in payload["inputs"]:
+            return "sagemaker-runtime.caption", json.dumps({"generated text": self.caption})
+        result = {"generated_text": self.comment}
+        if (payload.get("parameters") or {}).get("details"):
+            result["details"] = {"finish_reason": "eos_token", "generated_tokens": len(self.comment.split())}
+        return "sagemaker-runtime.llm", json.dumps([result])
+
+    def celebrities_response(self):
+        return {"CelebrityFaces": [{"Name": name} for name in self.celebrities]}
+
+    def text_response(self):
+        return {"TextDetections": [{"DetectedText": text} for text in self.detected_texts]}
+
+    async def fetch(self, url):
+        await self.simulate("http.fetch")
+        if url.startswith("file://"):
+            path = url[len("file://"):]
+        else:
+            path = os.path.join(self.images_dir, self.images[sum(url.encode()) % len(self.images)])
+        with open(path, "rb") as f:
+            return f.read()
@@ -0,0 +1,107 @@
+import io
+import os
+
+# Longest edge kept for Rekognition and captioning. BLIP resizes to 384px internally and
+# Rekognition text detection still reads signs and stickers comfortably at this size.
+DEFAULT_MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', 1600))
+DEFAULT_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 85))
+
+# Extensions the pipeline downloads, the real format is sniffed from the bytes
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+
+def is_image_url(url):
+    """Whether a submission URL points to an image the pipeline can process."""
+    return url.lower().split('?')[0].endswith(IMAGE_EXTENSIONS)
+
+
+def normalize_image(image_bytes, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_JPEG_QUALITY):
+    """
+    Normalize downloaded image bytes into a compact RGB JPEG.
+
+    The real format is sniffed from the content, animated GIF/WebP images keep
+    their first frame, EXIF orientation is applied, transparency is flattened
+    onto white and the longest edge is downscaled to `max_edge`. JPEGs that are
+    already small enough and upright are passed through untouched.
+
+    Returns the JPEG bytes and a dict describing the conversion.
+    Raises PIL.UnidentifiedImageError if the bytes are not an image.
+    """
+    # imported here so handlers can import is_image_url without loading Pillow at init
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(image_bytes))
+    source_format = image.format
+    source_size = image.size
+    frames = getattr(image, 'n_frames', 1)
+
+    orientation = image.getexif().get(0x0112, 1)
+    if source_format == 'JPEG' and image.mode == 'RGB' and max(source_size) <= max_edge and orientation == 1:
+        return image_bytes, conversion_info(source_format, source_size, source_size, frames, image_bytes, image_bytes)
+
+    if source_format == 'JPEG':
+        # let the decoder downscale by a power of two while decoding huge photos,
+        # the requested size must keep the aspect ratio or the draft is skipped
+        scale = min(1.0, max_edge / max(source_size))
+        image.draft('RGB', (int(source_size[0] * scale), int(source_size[1] * scale)))
+
+    # first frame of animated images
+    image.seek(0)
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    image.thumbnail((max_edge, max_edge), Image.BICUBIC)
+
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=quality)
+    normalized_bytes = output.getvalue()
+
+    return normalized_bytes, conversion_info(source_format, source_size, image.size, frames, image_bytes, normalized_bytes)
+
+
+def conversion_info(source_format, source_size, size, frames, source_bytes, normalized_bytes):
+    return {
+        'sourceFormat': source_format,
+        'sourceSize': source_size,
+        'size': size,
+        'frames': frames,
+        'sourceBytes': len(source_bytes),
+        'normalizedBytes': len(normalized_bytes),
+    }
+
+
+def prepare_image(image_url, metrics):
+    """Download an image and normalize it to a compact JPEG, or return None if it is not an image."""
+    from PIL import Image, UnidentifiedImageError
+
+    with metrics.stage('download'):
+        image_bytes = download_image(image_url)
+
+    # Sniff the real format, keep the first frame of animations and downscale huge photos
+    try:
+        with metrics.stage('normalize'):
+            image_bytes, image_info = normalize_image(image_bytes)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        # not an image, a truncated or corrupt download, or absurdly large dimensions
+        print(f"Skipping unreadable image: {image_url} ({e})")
+        metrics.count('unreadableImages')
+        return None
+
+    metrics.count('imageSourceBytes', image_info['sourceBytes'], unit='Bytes')
+    metrics.count('imageNormalizedBytes', image_info['normalizedBytes'], unit='Bytes')
+    return image_bytes
+
+
+def download_image(image_url):
+    """Download an image into memory."""
+    from urllib.request import urlopen
+
+    with urlopen(image_url, timeout=30) as response:
+        return response.read()
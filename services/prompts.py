@@ -0,0 +1,27 @@
+def initialize_prompt(response):
+        
+    reddit_post = response['title'] + '\n\n' + response['body'] if response['body'] else response['title']
+
+    user_prompt = f"""### Instruction:
+Respond to this Reddit post with an award winning top comment.
+
+### Reddit Post:
+{reddit_post}
+
+### Image Context:\n"""
+    
+    return user_prompt
+
+
+def format_image_context(image_caption, celebrities, detected_texts):
+    
+    image_context = f"""- Description:{image_caption}\n-Text:{detected_texts}\n-Celebrities:{celebrities}\n\n"""
+    
+    return image_context
+    
+
+def finalize_prompt(base_prompt, image_context):
+    
+    final_prompt = base_prompt + image_context + """### Response:\n"""
+    
+    return final_prompt
@@ -0,0 +1,120 @@
+import json
+import time
+import contextlib
+from collections import defaultdict
+
+# CloudWatch accepts at most 100 values per metric in one EMF record
+MAX_VALUES_PER_RECORD = 100
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile of a list of numbers (q in [0, 100])."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+class StageMetrics:
+    """
+    Per-invocation timing spans and counters, emitted as CloudWatch Embedded
+    Metric Format (EMF) log lines so the metrics can be graphed and alarmed on
+    straight from the Lambda logs.
+
+    Usage:
+        metrics = StageMetrics('phase-ii')
+        with metrics.stage('caption'):
+            image_caption = generate_image_caption(...)
+        metrics.record_cache('processedSubmission', hit=False)
+        metrics.emit()
+
+    Every stage is reported as a list of durations (one per span) and a
+    `<stage>Total`, plus `invocationDuration` and `<cache>HitRate` for every
+    cache recorded.
+    """
+
+    def __init__(self, function_name, namespace='LaughGen', clock=time.perf_counter):
+        self.function_name = function_name
+        self.namespace = namespace
+        self.clock = clock
+        self.start = clock()
+        self.durations = defaultdict(list)
+        self.counters = defaultdict(int)
+        self.counter_units = {}
+        self.caches = defaultdict(lambda: [0, 0])
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the enclosed block as one span of `name`, including when it raises."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.durations[name].append((self.clock() - start) * 1000)
+
+    def count(self, name, value=1, unit='Count'):
+        """Add `value` to a counter, published with the CloudWatch `unit` (e.g. 'Bytes')."""
+        self.counters[name] += value
+        self.counter_units[name] = unit
+
+    def record_cache(self, name, hit):
+        self.caches[name][0 if hit else 1] += 1
+
+    def summary(self):
+        """Per-invocation totals as a flat dict, e.g. for tests and benchmarks."""
+        summary = {'invocationDuration': (self.clock() - self.start) * 1000}
+        for name, values in self.durations.items():
+            summary[f'{name}Total'] = sum(values)
+            summary[f'{name}Count'] = len(values)
+        summary.update(self.counters)
+        for name, (hits, misses) in self.caches.items():
+            summary[f'{name}Hits'] = hits
+            summary[f'{name}Misses'] = misses
+            summary[f'{name}HitRate'] = 100.0 * hits / (hits + misses)
+        return summary
+
+    def records(self):
+        """Build the EMF records of the invocation. Long stage lists are split over several records."""
+        summary = self.summary()
+        units = {name: 'Milliseconds' if name == 'invocationDuration' or name.endswith('Total') else 'Count' for name in summary}
+        units.update(self.counter_units)
+        units.update({f'{name}HitRate': 'Percent' for name in self.caches})
+
+        records = []
+        first = dict(summary)
+        first_units = dict(units)
+        chunks = {name: [values[i:i + MAX_VALUES_PER_RECORD] for i in range(0, len(values), MAX_VALUES_PER_RECORD)]
+                  for name, values in self.durations.items()}
+        for name, name_chunks in chunks.items():
+            first[name] = name_chunks[0]
+            first_units[name] = 'Milliseconds'
+        records.append((first, first_units))
+
+        for i in range(1, max((len(c) for c in chunks.values()), default=1)):
+            extra = {name: name_chunks[i] for name, name_chunks in chunks.items() if i < len(name_chunks)}
+            records.append((extra, {name: 'Milliseconds' for name in extra}))
+
+        timestamp = int(time.time() * 1000)
+        return [
+            {
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': self.namespace,
+                        'Dimensions': [['FunctionName']],
+                        'Metrics': [{'Name': name, 'Unit': unit} for name, unit in record_units.items()],
+                    }],
+                },
+                'FunctionName': self.function_name,
+                **values,
+            }
+            for values, record_units in records
+        ]
+
+    def emit(self):
+        """Print the EMF records, which CloudWatch Logs turns into metrics."""
+        for record in self.records():
+            print(json.dumps(record))